@@ -15,12 +15,13 @@ from detectors import dtm
 from integrators import im
 from models import AuditTable
 from models import IntegrationTable
-from models import ResultTable
 from models import ScanTable
 from storages import Storage
 from utils.audit import get_audit_by_uuid
+from utils.scan import get_audit_scans_query
 from utils.scan import get_safe_url
 from utils.scan import get_scan_by_uuid
+from utils.scan import get_scan_results_query
 from utils.scan import validate_host
 
 from .authorizers import token_required
@@ -138,7 +139,7 @@ class AuditItem(Resource):
         params = Parser.AuditItemGetRequest.parse_args()
         if params["include_results"]:
             scan_ids = list(map(lambda scan: scan["id"], audit["scans"]))
-            results = list(ResultTable.select(ResultTable).where(ResultTable.scan_id << scan_ids).dicts())
+            results = list(get_scan_results_query(scan_ids).dicts())
             for scan in audit["scans"]:
                 scan["results"] = list(filter(lambda result: result["scan_id"] == scan["id"], results))
 
@@ -193,7 +194,7 @@ class AuditScan(Resource):
         try:
             detector = dtm.load_detector(params["detection_module"], None)
             if detector.TARGET_TYPE == DetectionTarget.HOST.value:
-                validate_host(params["target"])
+                validate_host(params["target"], detector.SHARDABLE)
             elif detector.TARGET_TYPE == DetectionTarget.URL.value:
                 params["target"] = get_safe_url(params["target"])
             else:
@@ -210,7 +211,7 @@ class AuditScan(Resource):
         audit, _ = get_audit_by_uuid(audit_uuid)
         params["audit_id"] = audit["id"]
 
-        current_scan_count = ScanTable.select().where(ScanTable.audit_id == params["audit_id"]).count()
+        current_scan_count = get_audit_scans_query(params["audit_id"]).count()
         if current_scan_count >= app.config["MAX_SCAN_COUNT_IN_EACH_AUDIT"]:
             abort(400, "Max scan count exceeded")
 
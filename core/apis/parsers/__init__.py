@@ -5,6 +5,7 @@ AUDIT_LIST_MAX_COUNT = 100
 AUDIT_LIST_DEFAULT_COUNT = 20
 
 SCAN_MAX_DURATION_IN_HOUR = 48
+SCAN_MAX_PRIORITY = 10
 
 
 class Parser:
@@ -58,10 +59,16 @@ class Parser:
         "max_duration", type=inputs.int_range(1, SCAN_MAX_DURATION_IN_HOUR), required=True, location="json"
     )
 
+    ScanSchedulePostRequest.add_argument(
+        "priority", type=inputs.int_range(0, SCAN_MAX_PRIORITY), default=0, location="json"
+    )
     ScanSchedulePostRequest.add_argument(
         "rrule", type=inputs.regex("^RRULE:.{,128}$"), default="", location="json"
     )
 
+    ScanDownloadGetRequest = reqparse.RequestParser()
+    ScanDownloadGetRequest.add_argument("digest", type=inputs.regex("^[0-9a-f]{64}$"), location="args")
+
     # Integration
     IntegrationPatchRequest = reqparse.RequestParser()
     IntegrationPatchRequest.add_argument(
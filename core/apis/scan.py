@@ -4,6 +4,8 @@ import pytz
 from flask import Response
 from flask import abort
 from flask import g
+from flask import request
+from flask import send_file
 from flask_restx import Namespace
 from flask_restx import Resource
 from flask_restx import fields
@@ -13,14 +15,18 @@ from models import ScanTable
 from storages import Storage
 from utils.scan import get_scan_by_uuid
 from utils.scan import validate_schedule
+from utils.schedule import RRULE_WEEKDAY_LIST
+from utils.schedule import SCHEDULE_SLOT_IN_MINUTE
+from utils.schedule import get_next_run_at
+from utils.schedule import get_schedule_load
+from utils.schedule import get_smoothed_minute
+from utils.schedule import get_weekly_rrule
 
 from .authorizers import token_required
 from .parsers import Parser
 
 api = Namespace("scan")
 
-RRULE_WEEKDAY_LIST = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
-
 ScanResultGetResponseSchema = api.model(
     "Scan Result Get Response",
     {
@@ -32,6 +38,33 @@ ScanResultGetResponseSchema = api.model(
     },
 )
 
+ScanLoadSlotGetResponseSchema = api.model(
+    "Scan Load Slot Get Response",
+    {
+        "weekday": fields.String(required=True),
+        "hour": fields.Integer(required=True),
+        "minute": fields.Integer(required=True),
+        "count": fields.Integer(required=True),
+    },
+)
+
+ScanLoadGetResponseSchema = api.model(
+    "Scan Load Get Response",
+    {
+        "slot_in_minute": fields.Integer(required=True),
+        "slots": fields.List(fields.Nested(ScanLoadSlotGetResponseSchema), required=True),
+    },
+)
+
+ScanReportGetResponseSchema = api.model(
+    "Scan Report Get Response",
+    {
+        "digest": fields.String(required=True),
+        "size": fields.Integer(required=True),
+        "created_at": fields.DateTime(required=True),
+    },
+)
+
 ScanGetResponseSchema = api.model(
     "Scan Get Response",
     {
@@ -41,6 +74,7 @@ ScanGetResponseSchema = api.model(
         "target": fields.String(required=True),
         "scheduled_at": fields.DateTime(required=True),
         "max_duration": fields.Integer(required=True),
+        "priority": fields.Integer(required=True),
         "rrule": fields.String(required=True),
         "started_at": fields.DateTime(required=True),
         "ended_at": fields.DateTime(required=True),
@@ -56,6 +90,26 @@ ScanGetResponseSchema = api.model(
 )
 
 
+@api.route("/schedule/load/")
+@api.doc(security="API Token")
+@api.response(200, HTTPStatus.OK.description)
+@api.response(401, HTTPStatus.UNAUTHORIZED.description)
+class ScanLoad(Resource):
+    @api.marshal_with(ScanLoadGetResponseSchema)
+    @token_required(admin=True)
+    def get(self):
+
+        """
+        Retrieve projected weekly start load of periodic scans
+        """
+
+        slots = []
+        for (weekday, hour, minute), count in sorted(get_schedule_load().items()):
+            weekday = RRULE_WEEKDAY_LIST[weekday]
+            slots.append({"weekday": weekday, "hour": hour, "minute": minute, "count": count})
+        return {"slot_in_minute": SCHEDULE_SLOT_IN_MINUTE, "slots": slots}
+
+
 @api.route("/<string:scan_uuid>/")
 @api.doc(security="API Token")
 @api.response(200, HTTPStatus.OK.description)
@@ -84,6 +138,7 @@ class ScanItem(Resource):
         """
 
         ScanTable.delete().where(ScanTable.uuid == scan_uuid).execute()
+        Storage().delete_scan(scan_uuid)
         return {}
 
 
@@ -112,11 +167,19 @@ class ScanSchedule(Resource):
 
         if len(params["rrule"]) > 0:
             scheduled_at = params["scheduled_at"].replace(tzinfo=pytz.utc)
-            weekday = RRULE_WEEKDAY_LIST[scheduled_at.weekday()]
+            weekday = scheduled_at.weekday()
             hour = scheduled_at.time().hour
-            params["rrule"] = "RRULE:FREQ=WEEKLY;BYDAY={};BYHOUR={};BYMINUTE=0;BYSECOND=0".format(
-                weekday, hour
-            )
+            # Spread periodic scans within the hour instead of starting all of them on the hour,
+            # including the first run
+            minute = get_smoothed_minute(scan["uuid"], weekday, hour)
+            scheduled_at = scheduled_at.replace(minute=minute, second=0, microsecond=0)
+            params["scheduled_at"] = scheduled_at
+            params["rrule"] = get_weekly_rrule(weekday, hour, minute)
+            # The first run stands for the occurrence it starts, so the periodic runs follow that occurrence
+            first_run_at = get_next_run_at(params["rrule"], scheduled_at, inc=True)
+            params["next_run_at"] = get_next_run_at(params["rrule"], first_run_at)
+        else:
+            params["next_run_at"] = None
 
         params["task_uuid"] = None
         params["started_at"] = None
@@ -142,6 +205,7 @@ class ScanSchedule(Resource):
             "scheduled_at": None,
             "max_duration": 0,
             "rrule": "",
+            "next_run_at": None,
             "started_at": None,
             "ended_at": None,
             "task_uuid": None,
@@ -152,6 +216,25 @@ class ScanSchedule(Resource):
         return get_scan_by_uuid(scan_uuid)[0]
 
 
+@api.route("/<string:scan_uuid>/report/")
+@api.doc(security="API Token")
+@api.response(200, HTTPStatus.OK.description)
+@api.response(401, HTTPStatus.UNAUTHORIZED.description)
+@api.response(403, HTTPStatus.FORBIDDEN.description)
+@api.response(404, HTTPStatus.NOT_FOUND.description)
+class ScanReport(Resource):
+    @api.marshal_with(ScanReportGetResponseSchema, as_list=True)
+    @token_required()
+    def get(self, scan_uuid):
+
+        """
+        Retrieve raw result history of the specified scan
+        """
+
+        get_scan_by_uuid(scan_uuid)
+        return list(Storage().history(scan_uuid))
+
+
 @api.route("/<string:scan_uuid>/download/")
 @api.doc(security="API Token")
 @api.response(
@@ -159,10 +242,17 @@ class ScanSchedule(Resource):
     HTTPStatus.OK.description,
     headers={"Content-Type": "text/plain", "Content-Disposition": "attachment"},
 )
+@api.response(
+    206,
+    HTTPStatus.PARTIAL_CONTENT.description,
+    headers={"Content-Type": "text/plain", "Content-Range": "bytes"},
+)
 @api.response(401, HTTPStatus.UNAUTHORIZED.description)
 @api.response(403, HTTPStatus.FORBIDDEN.description)
 @api.response(404, HTTPStatus.NOT_FOUND.description)
+@api.response(416, HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE.description)
 class ScanSchedule(Resource):
+    @api.expect(Parser.ScanDownloadGetRequest)
     @token_required()
     def get(self, scan_uuid):
 
@@ -170,6 +260,44 @@ class ScanSchedule(Resource):
         Retrieve raw result of the specified scan
         """
 
-        data = Storage().load(scan_uuid)
-        headers = {"Content-Type": "text/plain", "Content-Disposition": "attachment"}
-        return Response(response=data, status=200, headers=headers)
+        params = Parser.ScanDownloadGetRequest.parse_args()
+        report = Storage().load(scan_uuid, params["digest"])
+        if report is None:
+            abort(404, "Report not found")
+
+        headers = {
+            "Content-Type": "text/plain",
+            "Content-Disposition": "attachment",
+            "Accept-Ranges": "bytes",
+            "Vary": "Accept-Encoding",
+            "Cache-Control": "private, no-cache",
+        }
+        size = report.uncompressed_size
+        accepted = report.encoding != "identity" and request.accept_encodings[report.encoding] > 0
+        if report.path is not None and (report.encoding == "identity" or accepted and request.range is None):
+            # Files on a local disk are sent as they are, and send_file handles ranges of uncompressed reports
+            response = send_file(report.path, mimetype="text/plain", conditional=True)
+            response.headers.update(headers)
+            if report.encoding != "identity":
+                response.headers["Content-Encoding"] = report.encoding
+            return response
+
+        if request.range is not None:
+            # Ranges are always counted on the uncompressed report
+            byte_range = request.range.range_for_length(size)
+            if byte_range is None:
+                headers["Content-Range"] = "bytes */{}".format(size)
+                return Response(status=416, headers=headers)
+            start, stop = byte_range
+            headers["Content-Range"] = "bytes {}-{}/{}".format(start, stop - 1, size)
+            headers["Content-Length"] = str(stop - start)
+            return Response(report.iter_decoded(start, stop), status=206, headers=headers)
+
+        # Pass the compressed report through as it is to clients accepting the encoding
+        if accepted:
+            headers["Content-Encoding"] = report.encoding
+            headers["Content-Length"] = str(report.size)
+            return Response(report.iter_raw(), status=200, headers=headers)
+
+        headers["Content-Length"] = str(size)
+        return Response(report.iter_decoded(), status=200, headers=headers)
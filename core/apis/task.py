@@ -6,6 +6,7 @@ from flask_restx import Namespace
 from flask_restx import Resource
 
 from tasks.pending import PendingTaskHandler
+from tasks.pool import DetectorPoolHandler
 from tasks.running import RunningTaskHandler
 from tasks.schedule import TaskScheduler
 from tasks.stopped import StoppedTaskHandler
@@ -28,6 +29,7 @@ class Task(Resource):
             "pending": PendingTaskHandler(),
             "running": RunningTaskHandler(),
             "stopped": StoppedTaskHandler(),
+            "pool": DetectorPoolHandler(),
         }
 
         try:
@@ -5,22 +5,32 @@ import os
 import traceback
 
 from flask import Flask
+from flask import Response
 from flask import abort
 from flask import request
 from flask_cors import CORS
 from peewee import MySQLDatabase
+from peewee import fn
 
 from apis import api
 from apis.authorizers import jwt
+from apis.authorizers import token_required
 from detectors import dtm
 from integrators import im
 from models import AuditTable
+from models import CursorTable
+from models import DurationTable
 from models import IntegrationTable
+from models import ReportTable
 from models import ResultTable
 from models import ScanTable
+from models import SchemaVersionTable
 from models import TaskTable
 from models import db
+from models.migrations import migrate_schema
+from tasks import TaskProgress
 from utils import Utils
+from utils import metrics
 
 
 class FormatterJSON(logging.Formatter):
@@ -77,12 +87,44 @@ app.config["ADMIN_NAME"] = os.getenv("ADMIN_NAME", "NT-D ADMIN")
 app.config["ADMIN_PASSWORD"] = os.getenv("ADMIN_PASSWORD", "password")
 app.config["PERMITTED_SOURCE_IP_RANGES"] = os.getenv("PERMITTED_SOURCE_IP_RANGES", "")
 app.config["CORS_PERMITTED_ORIGINS"] = os.getenv("CORS_PERMITTED_ORIGINS", "*")
+app.config["PUBLIC_HOST"] = os.getenv("PUBLIC_HOST", "localhost:8080")
 app.config["JWT_SECRET_KEY"] = os.getenv("JWT_SECRET_KEY", "your-256-bit-secret")
 app.config["JWT_ACCESS_TOKEN_EXPIRES"] = 12 * 3600  # 12 hours
 app.config["JWT_IDENTITY_CLAIM"] = "sub"
 app.config["MAX_SCAN_COUNT_IN_EACH_AUDIT"] = 50
 app.config["SCAN_MAX_PENDING_DURATION_IN_HOUR"] = 4
 app.config["SCAN_MAX_RUNNING_DURATION_IN_HOUR"] = 6
+app.config["SCAN_PRIORITY_AGING_PER_HOUR"] = float(os.getenv("SCAN_PRIORITY_AGING_PER_HOUR", "1"))
+app.config["SCAN_FAIR_SHARE_PENALTY"] = float(os.getenv("SCAN_FAIR_SHARE_PENALTY", "1"))
+app.config["TASK_CHECK_MIN_INTERVAL_IN_SECOND"] = int(os.getenv("TASK_CHECK_MIN_INTERVAL_IN_SECOND", "10"))
+app.config["TASK_CHECK_MAX_INTERVAL_IN_SECOND"] = int(os.getenv("TASK_CHECK_MAX_INTERVAL_IN_SECOND", "600"))
+app.config["TASK_REQUEST_TIMEOUT_IN_SECOND"] = int(os.getenv("TASK_REQUEST_TIMEOUT_IN_SECOND", "90"))
+app.config["TASK_POLL_BUDGET_IN_SECOND"] = int(os.getenv("TASK_POLL_BUDGET_IN_SECOND", "45"))
+app.config["TASK_POLL_CONCURRENCY"] = int(os.getenv("TASK_POLL_CONCURRENCY", "1"))
+app.config["TASK_PROCESS_TIMEOUT_IN_SECOND"] = int(os.getenv("TASK_PROCESS_TIMEOUT_IN_SECOND", "60"))
+app.config["TASK_LEASE_IN_SECOND"] = int(os.getenv("TASK_LEASE_IN_SECOND", "300"))
+app.config["DETECTOR_EXECUTION_MODE"] = os.getenv("DETECTOR_EXECUTION_MODE", "exec")
+app.config["DETECTOR_MAX_SHARD_COUNT"] = int(os.getenv("DETECTOR_MAX_SHARD_COUNT", "4"))
+app.config["DETECTOR_POOL_MIN_SIZE"] = int(os.getenv("DETECTOR_POOL_MIN_SIZE", "0"))
+app.config["DETECTOR_POOL_MAX_SIZE"] = int(os.getenv("DETECTOR_POOL_MAX_SIZE", "0"))
+app.config["DETECTOR_POD_REUSE"] = os.getenv("DETECTOR_POD_REUSE", "False") == "True"
+app.config["DETECTOR_IDLE_TIMEOUT_IN_SECOND"] = int(os.getenv("DETECTOR_IDLE_TIMEOUT_IN_SECOND", "600"))
+app.config["DETECTOR_ADMISSION_CONTROL"] = os.getenv("DETECTOR_ADMISSION_CONTROL", "True") == "True"
+app.config["DETECTOR_CPU_BUDGET"] = os.getenv("DETECTOR_CPU_BUDGET", "")
+app.config["DETECTOR_MEMORY_BUDGET"] = os.getenv("DETECTOR_MEMORY_BUDGET", "")
+app.config["DETECTOR_MAX_CONCURRENT_TASKS"] = int(os.getenv("DETECTOR_MAX_CONCURRENT_TASKS", "0"))
+app.config["SCHEMA_AUTO_MIGRATE"] = os.getenv("SCHEMA_AUTO_MIGRATE", "True") == "True"
+app.config["STORAGE_BACKEND"] = os.getenv("STORAGE_BACKEND", "gcs" if Utils.is_gcp() else "null")
+app.config["STORAGE_LOCAL_ROOT"] = os.getenv("STORAGE_LOCAL_ROOT", "/var/lib/ntd")
+app.config["STORAGE_COMPRESSION"] = os.getenv("STORAGE_COMPRESSION", "gzip")
+app.config["STORAGE_REPORT_HISTORY_SIZE"] = int(os.getenv("STORAGE_REPORT_HISTORY_SIZE", "10"))
+app.config["STORAGE_UPLOAD_ASYNC"] = os.getenv("STORAGE_UPLOAD_ASYNC", "True") == "True"
+app.config["STORAGE_UPLOAD_CONCURRENCY"] = int(os.getenv("STORAGE_UPLOAD_CONCURRENCY", "4"))
+app.config["STORAGE_UPLOAD_RETRIES"] = int(os.getenv("STORAGE_UPLOAD_RETRIES", "3"))
+app.config["STORAGE_UPLOAD_TIMEOUT_IN_SECOND"] = int(os.getenv("STORAGE_UPLOAD_TIMEOUT_IN_SECOND", "15"))
+app.config["METRICS_QUEUE_DEPTH_INTERVAL_IN_SECOND"] = int(
+    os.getenv("METRICS_QUEUE_DEPTH_INTERVAL_IN_SECOND", "60")
+)
 app.config["RESTX_MASK_SWAGGER"] = False
 app.config["SWAGGER_UI_REQUEST_DURATION"] = True
 app.config["SWAGGER_UI_DOC_EXPANSION"] = "list"
@@ -94,8 +136,22 @@ jwt.init_app(app)
 jwt._set_error_handler_callbacks(api)
 CORS(app, origins=app.config["CORS_PERMITTED_ORIGINS"])
 
-with db.database:
-    db.database.create_tables([AuditTable, ScanTable, TaskTable, ResultTable, IntegrationTable])
+with app.app_context(), db.database:
+    db.database.create_tables(
+        [
+            AuditTable,
+            ScanTable,
+            TaskTable,
+            ResultTable,
+            ReportTable,
+            IntegrationTable,
+            DurationTable,
+            CursorTable,
+            SchemaVersionTable,
+        ]
+    )
+    if app.config["SCHEMA_AUTO_MIGRATE"]:
+        migrate_schema()
 
 dtm.init()
 im.init()
@@ -121,3 +177,18 @@ def check_source_ip():
 def add_header(response):
     response.headers["Cache-Control"] = "private, no-store, no-cache, must-revalidate"
     return response
+
+
+@app.route("/metrics", endpoint="metrics")
+@token_required(admin=True)
+def get_metrics():
+    # Queue depth is read from the database, because tasks are processed by any of instances and workers.
+    # It is cached for an interval, so that frequent scrapes do not load the database.
+    if metrics.task_queue_depth.is_stale(app.config["METRICS_QUEUE_DEPTH_INTERVAL_IN_SECOND"]):
+        task_query = TaskTable.select(TaskTable.progress, fn.COUNT(TaskTable.id).alias("count")).group_by(
+            TaskTable.progress
+        )
+        counts = dict([(task["progress"], task["count"]) for task in task_query.dicts()])
+        for progress in TaskProgress:
+            metrics.task_queue_depth.set(counts.get(progress.name, 0), progress=progress.name)
+    return Response(metrics.registry.expose(), mimetype="text/plain; version=0.0.4")
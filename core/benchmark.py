@@ -0,0 +1,233 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from flask import Flask
+
+from detectors import DetectorBase
+from detectors import dtm
+
+DEFAULT_BASELINE_FILE_PATH = "benchmark.json"
+DEFAULT_TOLERANCE = 0.2
+# Seconds and throughput depend on the machine, so only numbers comparable across machines are kept
+BASELINE_KEYS = ["report_size", "result_count", "relative_time", "peak_memory"]
+
+
+def generate_nmap_report(args):
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<nmaprun scanner="nmap" version="7.80">']
+    for i in range(args.hosts):
+        address = "203.0.{}.{}".format(i // 256 % 256, i % 256)
+        lines.append('<host><status state="up" reason="user-set"/>')
+        lines.append('<address addr="{}" addrtype="ipv4"/>'.format(address))
+        lines.append('<hostnames><hostname name="host{}.example.com" type="PTR"/></hostnames>'.format(i))
+        lines.append("<ports>")
+        for port in range(args.ports):
+            lines.append('<port protocol="tcp" portid="{}"><state state="open"/>'.format(port + 1))
+            lines.append('<service name="http" product="nginx" version="1.18.0"/>')
+            for script in range(args.scripts):
+                script_id = "http-methods" if script % 2 == 0 else "ssl-cert"
+                output = "Not valid after: 2020-01-01T00:00:00" if script % 2 else "GET HEAD POST OPTIONS"
+                lines.append('<script id="{}" output="{}"/>'.format(script_id, output))
+            lines.append("</port>")
+        lines.append("</ports>")
+        lines.append('<os><osmatch name="Linux 4.15" accuracy="95"/></os>')
+        lines.append("</host>")
+    lines.append("<runstats/></nmaprun>")
+    return "\n".join(lines).encode("utf-8")
+
+
+def generate_wpscan_report(args):
+    def get_component(kind, i):
+        return {
+            "slug": "{}-{}".format(kind, i),
+            "location": "https://example.com/wp-content/{}s/{}-{}/".format(kind, kind, i),
+            "version": {"number": "1.0.{}".format(i)},
+            "outdated": i % 2 == 0,
+            "latest_version": "2.0.0",
+            "last_updated": "2020-06-01T00:00:00.000Z",
+            "vulnerabilities": [],
+        }
+
+    report = {
+        "effective_url": "https://example.com/",
+        "interesting_findings": [
+            {
+                "url": "https://example.com/finding-{}".format(i),
+                "type": "headers",
+                "to_s": "Interesting finding {}".format(i),
+                "references": {"url": ["https://example.com/"]} if i % 2 else {},
+                "interesting_entries": ["Server: nginx"],
+            }
+            for i in range(args.findings)
+        ],
+        "version": {"number": "5.4.2", "release_date": "2020-06-10", "status": "insecure"},
+        "plugins": dict([("plugin-{}".format(i), get_component("plugin", i)) for i in range(args.plugins)]),
+        "themes": dict([("theme-{}".format(i), get_component("theme", i)) for i in range(args.themes)]),
+        "config_backups": {},
+        "db_exports": {},
+    }
+    return json.dumps(report).encode("utf-8")
+
+
+def generate_nikto_report(args):
+    report = {
+        "host": "example.com",
+        "ip": "203.0.113.1",
+        "port": "443",
+        "vulnerabilities": [
+            {"id": str(i), "method": "GET", "url": "/path-{}".format(i), "msg": "Vulnerability {}".format(i)}
+            for i in range(args.vulnerabilities)
+        ],
+    }
+    return json.dumps(report).encode("utf-8")
+
+
+REPORT_GENERATORS = {
+    "nmap_7_80": generate_nmap_report,
+    "wpscan_latest": generate_wpscan_report,
+    "nikto_master": generate_nikto_report,
+}
+
+
+def load_stubbed_detector(module, report):
+    # Detector is instantiated without Kubernetes client, and pod exec is replaced with the synthetic report
+    def get_report(pod):
+        f = tempfile.SpooledTemporaryFile(max_size=DetectorBase.REPORT_SPOOL_MAX_SIZE)
+        f.write(report)
+        f.seek(0)
+        return f
+
+    detector = dtm.detectors[module].__new__(dtm.detectors[module])
+    detector.session = {"pods": [{"name": "benchmark"}]}
+    detector._get_report = get_report
+    return detector
+
+
+CALIBRATION_DOCUMENT = [{"id": i, "name": "item-{}".format(i), "tags": ["a", "b", "c"]} for i in range(20000)]
+
+
+def run_calibration():
+    # Fixed pure Python workload timed along with each parse, so that parse times are compared relative to it
+    # instead of as absolute seconds which depend on the machine and its load
+    started_at = time.perf_counter()
+    items = json.loads(json.dumps(CALIBRATION_DOCUMENT))
+    "\n".join(["{}:{}".format(item["id"], item["name"].upper()) for item in items]).split("\n")
+    return time.perf_counter() - started_at
+
+
+def run_benchmark(module, report, repeat):
+    elapsed = []
+    calibration_elapsed = []
+    result_count = 0
+    for _ in range(repeat):
+        calibration_elapsed.append(run_calibration())
+        detector = load_stubbed_detector(module, report)
+        started_at = time.perf_counter()
+        results, raw_report = detector.get_results()
+        elapsed.append(time.perf_counter() - started_at)
+        raw_report.close()
+        result_count = len(results)
+
+    # Memory is measured in a separate run because tracing allocations slows down the parser
+    detector = load_stubbed_detector(module, report)
+    tracemalloc.start()
+    results, raw_report = detector.get_results()
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    raw_report.close()
+
+    seconds = min(elapsed)
+    # Each parse is compared with the calibration run next to it, which has seen the same load of the machine
+    relative_times = sorted([e / c for e, c in zip(elapsed, calibration_elapsed)])
+    return {
+        "report_size": len(report),
+        "result_count": result_count,
+        "seconds": seconds,
+        "relative_time": relative_times[len(relative_times) // 2],
+        "throughput": len(report) / seconds,
+        "peak_memory": peak_memory,
+    }
+
+
+def compare_with_baseline(module, stats, baseline, tolerance):
+    regressions = []
+    if module not in baseline:
+        return regressions
+    if baseline[module]["report_size"] != stats["report_size"]:
+        print(" * Skip comparison for {}: report size differs from baseline".format(module))
+        return regressions
+    for key in ["relative_time", "peak_memory"]:
+        if key not in baseline[module]:
+            continue
+        limit = baseline[module][key] * (1 + tolerance)
+        if stats[key] > limit:
+            regressions.append("{}: {} {:.4g} exceeds baseline {:.4g}".format(module, key, stats[key], limit))
+    return regressions
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Benchmark detector result parsers with synthetic reports")
+    parser.add_argument("--modules", nargs="*", default=sorted(REPORT_GENERATORS.keys()))
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--hosts", type=int, default=256)
+    parser.add_argument("--ports", type=int, default=20)
+    parser.add_argument("--scripts", type=int, default=2)
+    parser.add_argument("--findings", type=int, default=100)
+    parser.add_argument("--plugins", type=int, default=5000)
+    parser.add_argument("--themes", type=int, default=500)
+    parser.add_argument("--vulnerabilities", type=int, default=20000)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_FILE_PATH)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--save-baseline", action="store_true")
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    app = Flask(__name__)
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+
+    stats = {}
+    regressions = []
+    with app.app_context():
+        dtm.init()
+        for module in args.modules:
+            report = REPORT_GENERATORS[module](args)
+            stats[module] = run_benchmark(module, report, args.repeat)
+            print(
+                "{:<16} size={:>10}B results={:>8} time={:>8.3f}s relative={:>6.2f} throughput={:>8.2f}MB/s "
+                "peak={:>8.2f}MB".format(
+                    module,
+                    stats[module]["report_size"],
+                    stats[module]["result_count"],
+                    stats[module]["seconds"],
+                    stats[module]["relative_time"],
+                    stats[module]["throughput"] / 1024 / 1024,
+                    stats[module]["peak_memory"] / 1024 / 1024,
+                )
+            )
+            regressions.extend(compare_with_baseline(module, stats[module], baseline, args.tolerance))
+
+    if args.save_baseline:
+        baseline = dict(
+            [(module, dict([(key, stats[module][key]) for key in BASELINE_KEYS])) for module in stats]
+        )
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+        print(" * Saved baseline to {}".format(args.baseline))
+
+    for regression in regressions:
+        print(" * Regression: {}".format(regression))
+    return 1 if len(regressions) > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,11 +9,13 @@ PENDING_TASK_ENDPOINT = "task/pending/"
 RUNNING_TASK_ENDPOINT = "task/running/"
 STOPPED_TASK_ENDPOINT = "task/stopped/"
 TASK_SCHEDULE_ENDPOINT = "task/schedule/"
+DETECTOR_POOL_ENDPOINT = "task/pool/"
 
 PENDING_TASK_INTERVAL = 10
 RUNNING_TASK_INTERVAL = 10
 STOPPED_TASK_INTERVAL = 10
 TASK_SCHEDULE_INTERVAL = 10
+DETECTOR_POOL_INTERVAL = 10
 
 
 def handlePendingTask():
@@ -40,6 +42,12 @@ def handleTaskSchedule():
         time.sleep(TASK_SCHEDULE_INTERVAL)
 
 
+def handleDetectorPool():
+    while True:
+        invoke(DETECTOR_POOL_ENDPOINT)
+        time.sleep(DETECTOR_POOL_INTERVAL)
+
+
 def invoke(endpoint):
     headers = {"X-AppEngine-Cron": "true"}
     url = REM_SERVER_HOST + endpoint
@@ -52,6 +60,7 @@ def main():
     executor.submit(handleRunningTask)
     executor.submit(handleStoppedTask)
     executor.submit(handleTaskSchedule)
+    executor.submit(handleDetectorPool)
 
 
 print(' * Serving local task scheduler "cron.py"')
@@ -2,28 +2,41 @@ import importlib
 import json
 import logging
 import os
+import shlex
 import sys
+import tempfile
+import threading
+import time
 import uuid
 from abc import ABCMeta
 from abc import abstractmethod
-from ast import literal_eval
 from enum import Enum
 from enum import unique
 
 import requests
 from flask import current_app as app
 from kubernetes import config
+from kubernetes.client import ApiClient
 from kubernetes.client import Configuration
 from kubernetes.client.api import core_v1_api
+from kubernetes.client.rest import ApiException
 from kubernetes.stream import stream
 
 from utils import Utils
+from utils import metrics
+from utils import serializer
+from utils.scan import get_network_shards
+from utils.scan import is_network
 
 kslogger = logging.getLogger("kubernetes")
 console_h = logging.StreamHandler()
 kslogger.addHandler(console_h)
 kslogger.setLevel(logging.DEBUG)
 
+DETECTOR_POD_LABEL = "ntd-detector"
+DETECTOR_IDLE_SINCE_ANNOTATION = "ntd-detector/idle-since"
+DETECTOR_OPERATIONS = ["create", "delete", "run", "is_ready", "is_running", "get_results"]
+
 
 class DetectorManager:
     def __init__(self):
@@ -38,6 +51,8 @@ class DetectorManager:
             fname, ext = os.path.splitext(f)
             if ext == ".py" and fname != "__init__":
                 module = importlib.import_module(fname)
+                module.Detector.MODULE = fname
+                self.measure(module.Detector)
                 self.detectors[fname] = module.Detector
         sys.path.pop(0)
 
@@ -57,6 +72,16 @@ class DetectorManager:
     def get_info(self):
         return self.info
 
+    def measure(self, detector):
+        for operation in DETECTOR_OPERATIONS:
+            measure = metrics.measure(
+                metrics.detector_operation_seconds,
+                metrics.detector_operation_errors,
+                module=detector.MODULE,
+                operation=operation,
+            )
+            setattr(detector, operation, measure(getattr(detector, operation)))
+
     def load_detector(self, module, session):
         try:
             return self.detectors[module](session)
@@ -84,6 +109,18 @@ class ReleaseStage(Enum):
     DEPRECATED = "Deprecated"
 
 
+@unique
+class ExecutionMode(Enum):
+    EXEC = "exec"
+    ENTRYPOINT = "entrypoint"
+
+
+@unique
+class PodPoolState(Enum):
+    IDLE = "idle"
+    LEASED = "leased"
+
+
 @unique
 class Severity(Enum):
     HIGH = "High"
@@ -93,11 +130,13 @@ class Severity(Enum):
 
 
 class LocalKubernetesConfiguration:
-    def set_config(self):
-        config.load_kube_config()
+    def get_config(self):
         configuration = Configuration()
+        config.load_kube_config(client_configuration=configuration)
         configuration.assert_hostname = False
-        Configuration.set_default(configuration)
+        # Tokens of exec plugins and auth providers do expire, but their expiry is not exposed by the loader,
+        # so they are reloaded when the API server rejects them instead
+        return configuration, None
 
 
 class GKEConfiguration:
@@ -105,24 +144,110 @@ class GKEConfiguration:
     METADATA_TOKEN_ENDPOINT = (
         "http://metadata.google.internal/computeMetadata/v1/instance/service-accounts/default/token"
     )
+    REQUEST_TIMEOUT_IN_SECOND = 10
 
     def get_access_token(self):
         headers = {"Metadata-Flavor": "Google"}
-        resp = requests.get(GKEConfiguration.METADATA_TOKEN_ENDPOINT, headers=headers)
-        return json.loads(resp.text)["access_token"]
+        resp = requests.get(
+            GKEConfiguration.METADATA_TOKEN_ENDPOINT, headers=headers, timeout=self.REQUEST_TIMEOUT_IN_SECOND
+        )
+        token = json.loads(resp.text)
+        return token["access_token"], token["expires_in"]
 
-    def set_config(self):
+    def get_config(self):
+        access_token, expires_in = self.get_access_token()
         configuration = Configuration()
-        configuration.api_key["authorization"] = self.get_access_token()
+        configuration.api_key["authorization"] = access_token
         configuration.api_key_prefix["authorization"] = "Bearer"
         configuration.host = os.environ.get("GKE_MASTER_SERVER")
         configuration.verify_ssl = False
         configuration.assert_hostname = False
-        Configuration.set_default(configuration)
+        return configuration, expires_in
+
+
+class TimeoutApiClient(ApiClient):
+
+    REQUEST_TIMEOUT_IN_SECOND = 30
+
+    def __init__(self, configuration, refresh_token=None):
+        super().__init__(configuration)
+        self.refresh_token = refresh_token
+
+    def request(self, *args, **kwargs):
+        # Calls without their own timeout would keep a task handler waiting forever on a stalled connection
+        if kwargs.get("_request_timeout") is None:
+            kwargs["_request_timeout"] = self.REQUEST_TIMEOUT_IN_SECOND
+        try:
+            return super().request(*args, **kwargs)
+        except ApiException as error:
+            if error.status != 401 or self.refresh_token is None or kwargs.get("headers") is None:
+                raise
+            # Token has expired before its known expiry, so retry once with a reloaded one
+            self.refresh_token()
+            kwargs["headers"]["authorization"] = self.configuration.get_api_key_with_prefix("authorization")
+            return super().request(*args, **kwargs)
+
+
+class KubernetesClientManager:
+
+    TOKEN_REFRESH_MARGIN_IN_SECOND = 300
+    CONNECTION_POOL_MAX_SIZE = 32
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.api_client = None
+        self.expires_at = None
+
+    def get_core_api(self):
+        return core_v1_api.CoreV1Api(self._get_api_client())
+
+    def get_stream_api(self):
+        # `stream` temporarily replaces the request method of the given client,
+        # so exec calls must not share a client with other threads or regular API calls.
+        api_client = self._get_api_client()
+        if getattr(self.local, "configuration", None) is not api_client.configuration:
+            self.local.configuration = api_client.configuration
+            self.local.api_client = TimeoutApiClient(api_client.configuration, self._refresh_token)
+        return core_v1_api.CoreV1Api(self.local.api_client)
+
+    def _get_api_client(self):
+        with self.lock:
+            if self.api_client is None:
+                configuration, expires_in = self._load_config()
+                configuration.connection_pool_maxsize = self.CONNECTION_POOL_MAX_SIZE
+                self.api_client = TimeoutApiClient(configuration, self._refresh_token)
+                self._set_expiry(expires_in)
+            elif self.expires_at is not None and time.time() > self.expires_at:
+                self._update_token()
+            return self.api_client
+
+    def _refresh_token(self):
+        with self.lock:
+            self._update_token()
+
+    def _update_token(self):
+        # Refresh the token in place for keeping established connections in the pool
+        configuration, expires_in = self._load_config()
+        self.api_client.configuration.api_key.update(configuration.api_key)
+        self._set_expiry(expires_in)
+
+    def _load_config(self):
+        if Utils.is_gcp():
+            return GKEConfiguration().get_config()
+        else:
+            return LocalKubernetesConfiguration().get_config()
+
+    def _set_expiry(self, expires_in):
+        if expires_in is None:
+            self.expires_at = None
+        else:
+            self.expires_at = time.time() + expires_in - self.TOKEN_REFRESH_MARGIN_IN_SECOND
 
 
 class DetectorBase(metaclass=ABCMeta):
 
+    MODULE = "__module__"
     NAME = "__name__"
     VERSION = "__version__"
     SUPPORTED_MODE = []
@@ -137,33 +262,274 @@ class DetectorBase(metaclass=ABCMeta):
 
     CONTAINER_IMAGE = "__container_image__"
 
-    CMD_RUN_SCAN = "echo run > out.txt"
+    SHARDABLE = False
+    MAX_CONCURRENT_TASKS = None
+
+    # Commands are formatted with the working directory of each task, so that a pod can serve scans in turn.
+    # Sessions created before working directories were introduced keep using the former fixed directory.
+    WORKDIR_ROOT = "/tmp/ntd"
+    LEGACY_WORKDIR = "."
+    CMD_RUN_SCAN = "echo run > {workdir}/out.txt"
     CMD_CHECK_SCAN_STATUS = "ps x | wc -c"
-    CMD_GET_SCAN_RESULTS = "cat out.txt"
+    CMD_GET_SCAN_RESULTS = "cat {workdir}/out.txt"
+    CMD_GET_ERROR_REASON = "echo"
+    # Files in the workdir served by the report server of entrypoint pods
+    REPORT_FILE = "out.txt"
+    ERROR_FILE = None
+
+    # Scans leave markers in their workdir, and the readiness probe reports a pod ready once its scan finished
+    CMD_WRAP_SCAN = "{}; echo $? > {workdir}/exit_code; rm -f {workdir}/running"
+    CMD_CHECK_SCAN_FINISHED = "ls {root}/*/exit_code && ! ls {root}/*/running"
+
+    REPORT_SPOOL_MAX_SIZE = 1024 * 1024
+    REPORT_CHUNK_SIZE = 64 * 1024
+    EXEC_TIMEOUT_IN_SECOND = 60
+    REPORT_TIMEOUT_IN_SECOND = 300
+
+    # Entrypoint pods have a sidecar sharing the workdir, so that reports are read without exec after the scan
+    REPORT_SERVER_NAME = "report-server"
+    REPORT_SERVER_IMAGE = "busybox:1.32"
+    REPORT_SERVER_PORT = 8080
+    REPORT_SERVER_RESOURCE = {"memory": "16Mi", "cpu": "0.01"}
 
     @abstractmethod
     def __init__(self, session):
         try:
-            self.session = literal_eval(session)
+            self.session = serializer.load_session(session)
         except Exception:
             self.session = session
 
-        if Utils.is_gcp():
-            GKEConfiguration().set_config()
-        else:
-            LocalKubernetesConfiguration().set_config()
-        self.core_api = core_v1_api.CoreV1Api()
+        self.core_api = kcm.get_core_api()
 
     @abstractmethod
-    def create(self):
-        app.logger.info("Try to create detector: session={}".format(self.session))
+    def create(self, task_uuid, target, mode):
+        app.logger.info("Try to create detector: task={}, session={}".format(task_uuid, self.session))
+
+        execution_mode = app.config["DETECTOR_EXECUTION_MODE"]
+        pods = []
+        try:
+            # Network targets are split into shards and each shard is scanned by its own pod in parallel
+            for shard, shard_target in enumerate(self.get_shards(target)):
+                pod = {
+                    "target": shard_target,
+                    "workdir": "{}/{}-{}".format(self.WORKDIR_ROOT, task_uuid, shard),
+                }
+                if execution_mode == ExecutionMode.ENTRYPOINT.value:
+                    # The scanner runs as the main process and the container exits with its status,
+                    # so its pod cannot be shared with the warm pool.
+                    pod["report_server"] = True
+                    command = "mkdir -p {} && {}".format(
+                        pod["workdir"], self._get_command(self.CMD_RUN_SCAN, pod)
+                    )
+                    pod["name"] = self._create_pod(
+                        PodPoolState.LEASED.value, task_uuid, shard, command, workdir=pod["workdir"]
+                    )
+                else:
+                    # Lease an idle pod from the warm pool if possible, otherwise create a dedicated one
+                    pod["name"] = self._lease_pod(task_uuid, shard)
+                    if pod["name"] is None:
+                        pod["name"] = self._create_pod(PodPoolState.LEASED.value, task_uuid, shard)
+                        pod["probed"] = True
+                pods.append(pod)
+        except Exception:
+            for pod in pods:
+                self._delete_pod(pod["name"])
+            raise
+
+        app.logger.info("Created detector successfully: pods={}".format(pods))
+        self.session = {"pods": pods, "execution_mode": execution_mode}
+        return self.session
+
+    @abstractmethod
+    def delete(self):
+        app.logger.info("Try to delete detector: session={}".format(self.session))
+        for pod in self._get_session_pods():
+            # Pods are released to the warm pool for following scans where possible, instead of being deleted
+            if not (self._is_reusable(pod) and self._release_pod(pod)):
+                self._delete_pod(pod["name"])
+        app.logger.info("Deleted detector successfully: session={}".format(self.session))
+        return True
+
+    @abstractmethod
+    def run(self, target, mode):
+        app.logger.info("Try to run scan: target={}, mode={}, session={}".format(target, mode, self.session))
+        if self._get_execution_mode() == ExecutionMode.ENTRYPOINT.value:
+            # Scan has already been started by the container entrypoint
+            return self.session
+
+        for pod in self._get_session_pods():
+            # Scanners run in the default directory of the container, and only their outputs go to the workdir
+            command = "mkdir -p {workdir} && touch {workdir}/running; nohup {} > /dev/null 2>&1 &".format(
+                self._get_scan_command(pod, target), workdir=self._get_workdir(pod)
+            )
+            resp = self._pod_exec(command, pod)
+            app.logger.info("Run detector successfully: pod={}, resp={}".format(pod["name"], resp))
+        return self.session
+
+    @abstractmethod
+    def is_ready(self, pods=None):
+        app.logger.info("Try to check detector is ready: session={}".format(self.session))
+        known_pods = self._index_pods(pods)
+        for session_pod in self._get_session_pods():
+            resp = known_pods.get(session_pod["name"])
+            if resp is None:
+                resp = self._read_pod(session_pod)
+
+            app.logger.info("Checked detector is ready successfully: resp={}".format(resp))
+            if resp.status.phase == "Pending":
+                # TODO: Need to handle other phases, e.g., Running, Succeeded, Failed and Unknown
+                return False
+        return True
+
+    @abstractmethod
+    def is_running(self, pods=None):
+        app.logger.info("Try to check detector is running: session={}".format(self.session))
+        entrypoint = self._get_execution_mode() == ExecutionMode.ENTRYPOINT.value
+        known_pods = self._index_pods(pods)
+        for session_pod in self._get_session_pods():
+            pod = known_pods.get(session_pod["name"])
+            if pod is None and entrypoint:
+                pod = self._read_pod(session_pod)
+
+            # A pod that is no longer alive, or whose scanner has exited, cannot be running the scan
+            if pod is not None and (
+                pod.status.phase not in ["Pending", "Running"] or self._get_exit_code(pod) is not None
+            ):
+                app.logger.info(
+                    "Checked detector is running successfully: pod={}, phase={}, exit_code={}".format(
+                        session_pod["name"], pod.status.phase, self._get_exit_code(pod)
+                    )
+                )
+                continue
+            if entrypoint:
+                return True
+
+            # Readiness in the pod list tells whether the scan has finished, so tasks need no exec each.
+            # Pods leased from the warm pool, or created before the probe was introduced, are checked by exec.
+            if pod is not None and self._has_readiness_probe(pod):
+                if not self._is_scan_finished(pod):
+                    return True
+                continue
+
+            resp = self._pod_exec(self._get_command(self.CMD_CHECK_SCAN_STATUS, session_pod), session_pod)
+            app.logger.info(
+                "Checked detector is running successfully: pod={}, resp={}".format(session_pod["name"], resp)
+            )
+            if int(resp) != 0:
+                return True
+        return False
+
+    @abstractmethod
+    def get_results(self):
+        app.logger.info("Try to get scan results: session={}".format(self.session))
+        reports = [self._get_report(pod) for pod in self._get_session_pods()]
+        if len(reports) == 1:
+            report = reports[0]
+        else:
+            report = self.merge_reports(reports)
+        results = []
+        app.logger.info("Got scan result successfully: session={}".format(self.session))
+        return results, report
+
+    def get_shards(self, target):
+        if self.SHARDABLE and is_network(target):
+            return get_network_shards(target, app.config["DETECTOR_MAX_SHARD_COUNT"])
+        return [target]
 
+    def merge_reports(self, reports):
+        raise Exception("Detector `{}` does not support sharded targets".format(self.MODULE))
+
+    def get_pods(self):
+        app.logger.info("Try to get detector pods: module={}".format(self.MODULE))
+        resp = self.core_api.list_namespaced_pod(
+            namespace=self.POD_NAMESPACE, label_selector=self._get_label_selector(PodPoolState.LEASED.value)
+        )
+
+        # Index pods by task UUID, so that handlers can resolve statuses of all tasks from one response
+        pods = {}
+        for pod in resp.items:
+            if "task" in pod.metadata.labels:
+                pods.setdefault(pod.metadata.labels["task"], []).append(pod)
+
+        app.logger.info("Got detector pods successfully: module={}, count={}".format(self.MODULE, len(pods)))
+        return pods
+
+    def fill_pool(self, min_size, max_size, idle_timeout=None):
+        app.logger.info(
+            "Try to fill detector pool: module={}, min_size={}, max_size={}".format(
+                self.MODULE, min_size, max_size
+            )
+        )
+        resp = self.core_api.list_namespaced_pod(
+            namespace=self.POD_NAMESPACE, label_selector=self._get_label_selector(PodPoolState.IDLE.value)
+        )
+
+        pods = []
+        for pod in resp.items:
+            if pod.metadata.deletion_timestamp is not None:
+                continue
+            if pod.status.phase in ["Pending", "Running"]:
+                pods.append(pod)
+            else:
+                # Idle pods never run a scan, so any other phase means the pod is broken
+                self._delete_pod(pod.metadata.name)
+
+        # Keep the oldest pods because they are the most likely to be running already
+        pods.sort(key=lambda pod: pod.metadata.creation_timestamp)
+        # Pods beyond the minimum size, e.g., released by finished scans, are deleted once idle for too long
+        if idle_timeout is not None:
+            for pod in [pod for pod in pods[min_size:] if self._get_idle_seconds(pod) > idle_timeout]:
+                self._delete_pod(pod.metadata.name)
+                pods.remove(pod)
+        for pod in pods[max_size:]:
+            self._delete_pod(pod.metadata.name)
+        for _ in range(len(pods), min(min_size, max_size)):
+            self._create_pod(PodPoolState.IDLE.value)
+
+        app.logger.info(
+            "Filled detector pool successfully: module={}, idle={}".format(self.MODULE, len(pods))
+        )
+        return True
+
+    def _lease_pod(self, task_uuid, shard):
+        if app.config["DETECTOR_POOL_MAX_SIZE"] == 0:
+            return None
+
+        resp = self.core_api.list_namespaced_pod(
+            namespace=self.POD_NAMESPACE, label_selector=self._get_label_selector(PodPoolState.IDLE.value)
+        )
+        for pod in resp.items:
+            if pod.status.phase != "Running" or pod.metadata.deletion_timestamp is not None:
+                continue
+
+            # Resource version works as a precondition, so only one handler can lease the same pod
+            body = {
+                "metadata": {
+                    "labels": {"pool": PodPoolState.LEASED.value, "task": task_uuid, "shard": str(shard)},
+                    "resourceVersion": pod.metadata.resource_version,
+                }
+            }
+            try:
+                self.core_api.patch_namespaced_pod(
+                    name=pod.metadata.name, namespace=self.POD_NAMESPACE, body=body
+                )
+            except ApiException as error:
+                if error.status == 409:
+                    continue
+                raise
+            app.logger.info("Leased detector from pool: pod={}".format(pod.metadata.name))
+            return pod.metadata.name
+
+        return None
+
+    def _create_pod(
+        self, state, task_uuid=None, shard=None, command="while true;do date;sleep 5; done", workdir=None
+    ):
         pod_name = self.POD_NAME_PREFIX + "-" + uuid.uuid4().hex
-        resp = None
         pod_manifest = {
             "apiVersion": "v1",
             "kind": "Pod",
-            "metadata": {"name": pod_name},
+            "metadata": {"name": pod_name, "labels": self._get_labels(state, task_uuid, shard)},
             "spec": {
                 "restartPolicy": "Never",
                 "containers": [
@@ -171,7 +537,7 @@ class DetectorBase(metaclass=ABCMeta):
                         "image": self.CONTAINER_IMAGE,
                         "image_pull_policy": "IfNotPresent",
                         "name": self.POD_NAME_PREFIX,
-                        "command": ["sh", "-c", "while true;do date;sleep 5; done"],
+                        "command": ["sh", "-c", command],
                         "resources": {
                             "requests": self.POD_RESOURCE_REQUEST,
                             "limits": self.POD_RESOURCE_LIMIT,
@@ -180,71 +546,258 @@ class DetectorBase(metaclass=ABCMeta):
                 ],
             },
         }
+        if workdir is None and state == PodPoolState.LEASED.value:
+            # Only pods created for a scan are probed, so that idle pods in the warm pool cost no probes
+            pod_manifest["spec"]["containers"][0]["readinessProbe"] = {
+                "exec": {
+                    "command": [
+                        "sh",
+                        "-c",
+                        "({}) > /dev/null 2>&1".format(
+                            self.CMD_CHECK_SCAN_FINISHED.format(root=self.WORKDIR_ROOT)
+                        ),
+                    ]
+                },
+                "periodSeconds": 5,
+            }
+        elif workdir is not None:
+            # Report server keeps running after the scanner exits, and serves files in the shared workdir
+            volume_mount = {"name": "workdir", "mountPath": self.WORKDIR_ROOT}
+            pod_manifest["spec"]["volumes"] = [{"name": "workdir", "emptyDir": {}}]
+            pod_manifest["spec"]["containers"][0]["volumeMounts"] = [volume_mount]
+            pod_manifest["spec"]["containers"].append(
+                {
+                    "image": self.REPORT_SERVER_IMAGE,
+                    "image_pull_policy": "IfNotPresent",
+                    "name": self.REPORT_SERVER_NAME,
+                    "command": [
+                        "sh",
+                        "-c",
+                        "mkdir -p {0} && httpd -f -p {1} -h {0}".format(workdir, self.REPORT_SERVER_PORT),
+                    ],
+                    "volumeMounts": [volume_mount],
+                    "resources": {
+                        "requests": self.REPORT_SERVER_RESOURCE,
+                        "limits": self.REPORT_SERVER_RESOURCE,
+                    },
+                }
+            )
         resp = self.core_api.create_namespaced_pod(body=pod_manifest, namespace=self.POD_NAMESPACE)
-        app.logger.info("Created detector successfully: resp={}".format(resp))
-        self.session = {"pod": {"name": pod_name}}
-        return self.session
+        app.logger.info("Created detector pod successfully: resp={}".format(resp))
+        return pod_name
 
-    @abstractmethod
-    def delete(self):
-        app.logger.info("Try to delete detector: session={}".format(self.session))
+    def _is_reusable(self, pod):
+        if not app.config["DETECTOR_POD_REUSE"] or app.config["DETECTOR_POOL_MAX_SIZE"] == 0:
+            return False
+        # Sessions created before working directories were introduced left their reports outside of them.
+        # Pods with the readiness probe are not released, otherwise the pool would keep probing them idle.
+        return (
+            self._get_execution_mode() == ExecutionMode.EXEC.value
+            and "workdir" in pod
+            and not pod.get("probed")
+        )
+
+    def _release_pod(self, pod):
+        app.logger.info("Try to release detector pod: pod={}".format(pod["name"]))
         try:
-            resp = self.core_api.delete_namespaced_pod(
-                name=self.session["pod"]["name"], body={}, namespace=self.POD_NAMESPACE
-            )
-            app.logger.info("Deleted detector successfully: resp={}".format(resp))
+            # Scanner still running, e.g., on cancellation, would disturb the next scan in the same pod
+            resp = self._pod_exec(self._get_command(self.CMD_CHECK_SCAN_STATUS, pod), pod)
+            if int(resp) != 0:
+                return False
+            self._pod_exec("rm -rf {}".format(pod["workdir"]), pod)
+
+            body = {
+                "metadata": {
+                    "labels": {"pool": PodPoolState.IDLE.value, "task": None, "shard": None},
+                    "annotations": {DETECTOR_IDLE_SINCE_ANNOTATION: str(int(time.time()))},
+                }
+            }
+            self.core_api.patch_namespaced_pod(name=pod["name"], namespace=self.POD_NAMESPACE, body=body)
         except Exception as error:
-            app.logger.error("Error on delete detector: {}".format(error))
+            app.logger.warn("ERROR: pod={}, error={}".format(pod["name"], error))
+            return False
+
+        app.logger.info("Released detector pod successfully: pod={}".format(pod["name"]))
         return True
 
-    @abstractmethod
-    def run(self, target, mode):
-        app.logger.info("Try to run scan: target={}, mode={}, session={}".format(target, mode, self.session))
-        command = "nohup {} &".format(self.CMD_RUN_SCAN.format(target=target))
-        resp = self._pod_exec(command)
-        app.logger.info("Run detector successfully: resp={}".format(resp))
-        return self.session
+    def _get_idle_seconds(self, pod):
+        annotations = pod.metadata.annotations or {}
+        if DETECTOR_IDLE_SINCE_ANNOTATION in annotations:
+            return time.time() - int(annotations[DETECTOR_IDLE_SINCE_ANNOTATION])
+        return time.time() - pod.metadata.creation_timestamp.timestamp()
 
-    @abstractmethod
-    def is_ready(self):
-        app.logger.info("Try to check detector is ready: session={}".format(self.session))
-        resp = self.core_api.read_namespaced_pod(
-            name=self.session["pod"]["name"], namespace=self.POD_NAMESPACE
+    def _delete_pod(self, pod_name):
+        try:
+            self.core_api.delete_namespaced_pod(name=pod_name, body={}, namespace=self.POD_NAMESPACE)
+        except Exception as error:
+            app.logger.error("Error on delete detector pod: pod={}, error={}".format(pod_name, error))
+
+    def _read_pod(self, pod):
+        return self.core_api.read_namespaced_pod(name=pod["name"], namespace=self.POD_NAMESPACE)
+
+    def _index_pods(self, pods):
+        return dict([(pod.metadata.name, pod) for pod in pods or []])
+
+    def _get_session_pods(self):
+        # Sessions created before sharding was introduced have a single pod
+        if "pods" in self.session:
+            return self.session["pods"]
+        return [self.session["pod"]]
+
+    def _get_execution_mode(self):
+        # Sessions created before execution modes were introduced are always exec mode
+        return self.session.get("execution_mode", ExecutionMode.EXEC.value)
+
+    def _get_exit_code(self, pod):
+        # Only the scanner container tells the status of the scan, not the report server
+        for container_status in pod.status.container_statuses or []:
+            if container_status.name != self.POD_NAME_PREFIX:
+                continue
+            if container_status.state.terminated is not None:
+                return container_status.state.terminated.exit_code
+        return None
+
+    def _get_error_reason(self):
+        pod = self._get_session_pods()[0]
+        if self._get_execution_mode() != ExecutionMode.ENTRYPOINT.value:
+            return self._pod_exec(self._get_command(self.CMD_GET_ERROR_REASON, pod), pod)
+
+        reason = "Scan exited without report, exit_code={}".format(self._get_exit_code(self._read_pod(pod)))
+        if pod.get("report_server") and self.ERROR_FILE is not None:
+            error = tempfile.SpooledTemporaryFile(max_size=self.REPORT_SPOOL_MAX_SIZE)
+            self._get_served_file(self.ERROR_FILE, error, pod)
+            error.seek(0)
+            reason = "{}, error={}".format(reason, error.read().decode("utf-8", "replace"))
+        return reason
+
+    def _has_readiness_probe(self, pod):
+        return any([container.readiness_probe is not None for container in pod.spec.containers])
+
+    def _is_scan_finished(self, pod):
+        for condition in pod.status.conditions or []:
+            if condition.type == "Ready":
+                return condition.status == "True"
+        return False
+
+    def _get_command(self, command, pod, target=None):
+        return command.format(target=pod.get("target", target), workdir=self._get_workdir(pod))
+
+    def _get_scan_command(self, pod, target=None):
+        command = self.CMD_WRAP_SCAN.format(
+            self._get_command(self.CMD_RUN_SCAN, pod, target), workdir=self._get_workdir(pod)
         )
-
-        app.logger.info("Checked detector is ready successfully: resp={}".format(resp))
-        if resp.status.phase != "Pending":
-            return True
+        return "sh -c {}".format(shlex.quote(command))
+
+    def _get_workdir(self, pod):
+        return pod.get("workdir", self.LEGACY_WORKDIR)
+
+    def _get_labels(self, state, task_uuid=None, shard=None):
+        labels = {"app": DETECTOR_POD_LABEL, "module": self.MODULE, "pool": state}
+        if task_uuid is not None:
+            labels["task"] = task_uuid
+        if shard is not None:
+            labels["shard"] = str(shard)
+        return labels
+
+    def _get_label_selector(self, state):
+        return ",".join(["{}={}".format(k, v) for k, v in self._get_labels(state).items()])
+
+    def _get_report(self, pod):
+        # Report is spooled into a temporary file which spills to disk when it grows large,
+        # so the same copy can be fed into both the parser and the storage without buffering it as a string.
+        report = tempfile.SpooledTemporaryFile(max_size=self.REPORT_SPOOL_MAX_SIZE)
+        if pod.get("report_server"):
+            self._get_served_file(self.REPORT_FILE, report, pod)
+        elif self._get_execution_mode() == ExecutionMode.ENTRYPOINT.value:
+            # Entrypoint pods created before the report server existed printed the report after the scan
+            resp = self.core_api.read_namespaced_pod_log(
+                name=pod["name"],
+                namespace=self.POD_NAMESPACE,
+                container=self.POD_NAME_PREFIX,
+                _preload_content=False,
+            )
+            try:
+                for chunk in resp.stream(self.REPORT_CHUNK_SIZE):
+                    report.write(chunk)
+            finally:
+                resp.release_conn()
         else:
-            # TODO: Need to handle other phases, e.g., Running, Succeeded, Failed and Unknown
-            return False
-
-    @abstractmethod
-    def is_running(self):
-        app.logger.info("Try to check detector is running: session={}".format(self.session))
-        resp = self._pod_exec(self.CMD_CHECK_SCAN_STATUS)
-        app.logger.info("Checked detector is running successfully: resp={}".format(resp))
-        return int(resp) != 0
-
-    @abstractmethod
-    def get_results(self):
-        app.logger.info("Try to get scan results: session={}".format(self.session))
-        report = self._pod_exec(self.CMD_GET_SCAN_RESULTS)
-        results = []
-        app.logger.info("Got scan result successfully: report={}".format(report))
-        return results, report
+            self._pod_exec_to_file(self._get_command(self.CMD_GET_SCAN_RESULTS, pod), report, pod)
+
+        app.logger.info("Got scan report: pod={}, size={}".format(pod["name"], report.tell()))
+        report.seek(0)
+        return report
+
+    def _get_report_timeout(self):
+        # Reports are fetched by the last task of a poll at the latest, so the fetch gets the time left
+        # in the request after the poll budget and the upload wait
+        timeout = (
+            app.config["TASK_REQUEST_TIMEOUT_IN_SECOND"]
+            - app.config["TASK_POLL_BUDGET_IN_SECOND"]
+            - app.config["STORAGE_UPLOAD_TIMEOUT_IN_SECOND"]
+        )
+        return max(min(timeout, self.REPORT_TIMEOUT_IN_SECOND), 1)
 
-    def _pod_exec(self, command):
+    def _get_served_file(self, filename, f, pod):
+        try:
+            resp = self.core_api.connect_get_namespaced_pod_proxy_with_path(
+                name="{}:{}".format(pod["name"], self.REPORT_SERVER_PORT),
+                namespace=self.POD_NAMESPACE,
+                path=filename,
+                _preload_content=False,
+                _request_timeout=self._get_report_timeout(),
+            )
+        except ApiException as error:
+            # Scanner may exit without writing the file, which is the same as an empty output
+            if error.status == 404:
+                return
+            raise
+        try:
+            for chunk in resp.stream(self.REPORT_CHUNK_SIZE):
+                f.write(chunk)
+        finally:
+            resp.release_conn()
+
+    def _pod_exec_to_file(self, command, f, pod):
+        resp = stream(
+            kcm.get_stream_api().connect_get_namespaced_pod_exec,
+            pod["name"],
+            self.POD_NAMESPACE,
+            command=["/bin/sh", "-c", command],
+            stderr=True,
+            stdin=False,
+            stdout=True,
+            tty=False,
+            _preload_content=False,
+        )
+        deadline = time.monotonic() + self._get_report_timeout()
+        try:
+            while resp.is_open():
+                if time.monotonic() > deadline:
+                    raise Exception("Timed out to get report: pod={}".format(pod["name"]))
+                resp.update(timeout=1)
+                if resp.peek_stdout():
+                    f.write(resp.read_stdout().encode("utf-8"))
+                if resp.peek_stderr():
+                    app.logger.warn("Got stderr on exec: stderr={}".format(resp.read_stderr()))
+        finally:
+            resp.close()
+
+    def _pod_exec(self, command, pod=None):
+        if pod is None:
+            pod = self._get_session_pods()[0]
         return stream(
-            self.core_api.connect_get_namespaced_pod_exec,
-            self.session["pod"]["name"],
+            kcm.get_stream_api().connect_get_namespaced_pod_exec,
+            pod["name"],
             self.POD_NAMESPACE,
             command=["/bin/sh", "-c", command],
             stderr=True,
             stdin=False,
             stdout=True,
             tty=False,
+            _request_timeout=self.EXEC_TIMEOUT_IN_SECOND,
         )
 
 
+kcm = KubernetesClientManager()
 dtm = DetectorManager()
@@ -1,11 +1,9 @@
-import json
-from ast import literal_eval
-
 from detectors import DetectionMode
 from detectors import DetectionTarget
 from detectors import DetectorBase
 from detectors import ReleaseStage
 from detectors import Severity
+from utils import serializer
 
 
 class Detector(DetectorBase):
@@ -22,20 +20,25 @@ class Detector(DetectorBase):
     POD_RESOURCE_REQUEST = {"memory": "512Mi", "cpu": "0.5"}
     POD_RESOURCE_LIMIT = {"memory": "1Gi", "cpu": "1"}
 
+    LEGACY_WORKDIR = "/tmp"
+
     CONTAINER_IMAGE = "docker.io/securecodebox/nikto:master"
 
     CMD_RUN_SCAN = (
-        "nikto-master/program/nikto.pl -h {target} -o /tmp/result.json  > /dev/null 2> /tmp/error.txt"
+        "nikto-master/program/nikto.pl -h {target} -o {workdir}/result.json "
+        " > /dev/null 2> {workdir}/error.txt"
     )
     CMD_CHECK_SCAN_STATUS = "ps x | grep nikto | grep -v grep | wc -c"
-    CMD_GET_SCAN_RESULTS = "cat /tmp/result.json"
-    CMD_GET_ERROR_REASON = "cat /tmp/error.txt"
+    CMD_GET_SCAN_RESULTS = "cat {workdir}/result.json"
+    CMD_GET_ERROR_REASON = "cat {workdir}/error.txt"
+    REPORT_FILE = "result.json"
+    ERROR_FILE = "error.txt"
 
     def __init__(self, session):
         super().__init__(session)
 
-    def create(self):
-        return super().create()
+    def create(self, task_uuid, target, mode):
+        return super().create(task_uuid, target, mode)
 
     def delete(self):
         return super().delete()
@@ -43,17 +46,18 @@ class Detector(DetectorBase):
     def run(self, target, mode):
         return super().run(target, mode)
 
-    def is_ready(self):
-        return super().is_ready()
+    def is_ready(self, pods=None):
+        return super().is_ready(pods)
 
-    def is_running(self):
-        return super().is_running()
+    def is_running(self, pods=None):
+        return super().is_running(pods)
 
     def get_results(self):
-        results, report = super().get_results()
+        results, raw_report = super().get_results()
 
+        report = raw_report.read()
         if len(report) > 0:
-            report = literal_eval(report)
+            report = serializer.loads(report)
             for vulnerability in report["vulnerabilities"]:
                 results.append(
                     {
@@ -67,7 +71,7 @@ class Detector(DetectorBase):
                     }
                 )
         else:
-            resp = self._pod_exec(self.CMD_GET_ERROR_REASON)
-            raise Exception(resp)
+            raise Exception(self._get_error_reason())
 
-        return results, json.dumps(report)
+        raw_report.seek(0)
+        return results, raw_report
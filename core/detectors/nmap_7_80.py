@@ -1,7 +1,9 @@
 import re
+import tempfile
 import xml.etree.ElementTree as et
 from datetime import datetime
 from datetime import timedelta
+from xml.sax.saxutils import quoteattr
 
 import pytz
 from flask import current_app as app
@@ -42,10 +44,13 @@ class Detector(DetectorBase):
 
     CONTAINER_IMAGE = "docker.io/instrumentisto/nmap:7.80"
 
+    SHARDABLE = True
+
     # ToDo: Add -T2
-    CMD_RUN_SCAN = "nmap -Pn -sC -sV -O -oX out.xml {target} > /dev/null 2>&1"
+    CMD_RUN_SCAN = "nmap -Pn -sC -sV -O -oX {workdir}/out.xml {target} > /dev/null 2>&1"
     CMD_CHECK_SCAN_STATUS = "ps x | grep nmap | grep -v grep | wc -c"
-    CMD_GET_SCAN_RESULTS = "cat out.xml"
+    CMD_GET_SCAN_RESULTS = "cat {workdir}/out.xml"
+    REPORT_FILE = "out.xml"
 
     SAFE_PORTS = ["80", "443"]
 
@@ -74,8 +79,8 @@ class Detector(DetectorBase):
     def __init__(self, session):
         super().__init__(session)
 
-    def create(self):
-        return super().create()
+    def create(self, task_uuid, target, mode):
+        return super().create(task_uuid, target, mode)
 
     def delete(self):
         return super().delete()
@@ -83,56 +88,89 @@ class Detector(DetectorBase):
     def run(self, target, mode):
         return super().run(target, mode)
 
-    def is_ready(self):
-        return super().is_ready()
+    def is_ready(self, pods=None):
+        return super().is_ready(pods)
 
-    def is_running(self):
-        return super().is_running()
+    def is_running(self, pods=None):
+        return super().is_running(pods)
 
     def get_results(self):
         results, report = super().get_results()
-        results_script = []
-
-        nmaprun = et.fromstring(report)
-        host = nmaprun.find("host")
+        results.extend(self.iter_results(report))
+        report.seek(0)
+        return results, report
 
-        address = host.find("address").get("addr")
-        status = host.find("status").get("state")
-        if status != "up":
-            raise Exception("Host '{}' is not running, status={}".format(address, status))
+    def merge_reports(self, reports):
+        # Combine host elements of all shard reports into one report under the first shard's root element
+        merged = tempfile.SpooledTemporaryFile(max_size=self.REPORT_SPOOL_MAX_SIZE)
+        for i, report in enumerate(reports):
+            context = et.iterparse(report, events=("start", "end"))
+            _, nmaprun = next(context)
+            if i == 0:
+                attrs = "".join([" {}={}".format(k, quoteattr(v)) for k, v in nmaprun.attrib.items()])
+                header = '<?xml version="1.0" encoding="UTF-8"?>\n<nmaprun{}>\n'.format(attrs)
+                merged.write(header.encode("utf-8"))
+            for event, element in context:
+                if event == "end" and element.tag == "host":
+                    merged.write(et.tostring(element))
+                    nmaprun.clear()
+            report.close()
+        merged.write(b"</nmaprun>\n")
+        merged.seek(0)
+        return merged
+
+    def iter_results(self, report):
+        # Parse the report incrementally and drop each host element once its results are emitted,
+        # so that memory usage does not grow with the number of scanned hosts.
+        context = et.iterparse(report, events=("start", "end"))
+        _, nmaprun = next(context)
+
+        down_hosts = []
+        up_host_count = 0
+        for event, element in context:
+            if event != "end" or element.tag != "host":
+                continue
+
+            address = element.find("address").get("addr")
+            status = element.find("status").get("state")
+            if status == "up":
+                up_host_count += 1
+                yield from self._get_host_results(element, address)
+            else:
+                down_hosts.append("{} ({})".format(address, status))
+            nmaprun.clear()
+
+        if up_host_count == 0:
+            raise Exception("Host is not running, hosts={}".format(", ".join(down_hosts)))
+
+    def _get_host_results(self, host, address):
+        results_script = []
 
-        hostnames = host.find("hostnames")
         hostnames_desc = ""
-        for hostname in hostnames.findall("hostname"):
+        for hostname in host.iterfind("hostnames/hostname"):
             hostnames_desc += "{} ({})\n".format(hostname.get("name"), hostname.get("type"))
-        results.append(
-            {
-                "host": address,
-                "port": None,
-                "name": "Hostnames",
-                "description": hostnames_desc.strip(),
-                "severity": Severity.INFO.value,
-            }
-        )
-
-        oses = host.find("os")
+        yield {
+            "host": address,
+            "port": None,
+            "name": "Hostnames",
+            "description": hostnames_desc.strip(),
+            "severity": Severity.INFO.value,
+        }
+
         oses_desc = ""
-        for osmatch in oses.findall("osmatch"):
+        for osmatch in host.iterfind("os/osmatch"):
             oses_desc += "{} ({}%)\n".format(osmatch.get("name"), osmatch.get("accuracy"))
-        results.append(
-            {
-                "host": address,
-                "port": None,
-                "name": "OS Detection",
-                "description": oses_desc.strip(),
-                "severity": Severity.INFO.value,
-            }
-        )
-
-        ports = host.find("ports")
+        yield {
+            "host": address,
+            "port": None,
+            "name": "OS Detection",
+            "description": oses_desc.strip(),
+            "severity": Severity.INFO.value,
+        }
+
         openports_desc = ""
         openports_severity = Severity.INFO.value
-        for port in ports.findall("port"):
+        for port in host.iterfind("ports/port"):
             state = port.find("state")
             if "open" in state.get("state"):
                 # Open Ports
@@ -169,15 +207,12 @@ class Detector(DetectorBase):
                         }
                     )
 
-        results.append(
-            {
-                "host": address,
-                "port": None,
-                "name": "Open Ports",
-                "description": openports_desc.strip(),
-                "severity": openports_severity,
-            }
-        )
-
-        results.extend(results_script)
-        return results, report
+        yield {
+            "host": address,
+            "port": None,
+            "name": "Open Ports",
+            "description": openports_desc.strip(),
+            "severity": openports_severity,
+        }
+
+        yield from results_script
@@ -1,11 +1,9 @@
-import json
-from ast import literal_eval
-
 from detectors import DetectionMode
 from detectors import DetectionTarget
 from detectors import DetectorBase
 from detectors import ReleaseStage
 from detectors import Severity
+from utils import serializer
 
 
 class Detector(DetectorBase):
@@ -22,17 +20,20 @@ class Detector(DetectorBase):
     POD_RESOURCE_REQUEST = {"memory": "512Mi", "cpu": "0.5"}
     POD_RESOURCE_LIMIT = {"memory": "1Gi", "cpu": "1"}
 
+    LEGACY_WORKDIR = "/wpscan"
+
     CONTAINER_IMAGE = "docker.io/wpscanteam/wpscan:latest"
 
-    CMD_RUN_SCAN = "wpscan --url {target} --update --disable-tls-checks --rua -t 200 -e ap,at,tt,cb,dbe -f json -o /wpscan/out.json > /dev/null 2>&1"
+    CMD_RUN_SCAN = "wpscan --url {target} --update --disable-tls-checks --rua -t 200 -e ap,at,tt,cb,dbe -f json -o {workdir}/out.json > /dev/null 2>&1"
     CMD_CHECK_SCAN_STATUS = "ps x | grep wpscan | grep -v grep | wc -c"
-    CMD_GET_SCAN_RESULTS = "cat /wpscan/out.json"
+    CMD_GET_SCAN_RESULTS = "cat {workdir}/out.json"
+    REPORT_FILE = "out.json"
 
     def __init__(self, session):
         super().__init__(session)
 
-    def create(self):
-        return super().create()
+    def create(self, task_uuid, target, mode):
+        return super().create(task_uuid, target, mode)
 
     def delete(self):
         return super().delete()
@@ -40,15 +41,15 @@ class Detector(DetectorBase):
     def run(self, target, mode):
         return super().run(target, mode)
 
-    def is_ready(self):
-        return super().is_ready()
+    def is_ready(self, pods=None):
+        return super().is_ready(pods)
 
-    def is_running(self):
-        return super().is_running()
+    def is_running(self, pods=None):
+        return super().is_running(pods)
 
     def get_results(self):
-        results, report = super().get_results()
-        report = literal_eval(report)
+        results, raw_report = super().get_results()
+        report = serializer.load(raw_report)
 
         if "scan_aborted" in report:
             raise Exception(report["scan_aborted"])
@@ -141,4 +142,5 @@ class Detector(DetectorBase):
                 {"host": url, "name": "Database exports", "description": url, "severity": Severity.HIGH.value}
             )
 
-        return results, json.dumps(report)
+        raw_report.seek(0)
+        return results, raw_report
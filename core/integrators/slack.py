@@ -2,6 +2,9 @@ import json
 from urllib.parse import urlparse
 
 import requests
+from flask import current_app as app
+from flask import g
+from flask import has_request_context
 from flask import request
 
 from detectors import Severity
@@ -9,6 +12,8 @@ from detectors import dtm
 from integrators import AbstractIntegrator
 from integrators import NotificationType
 
+SLACK_REQUEST_TIMEOUT_IN_SECOND = 10
+
 
 class Integrator(AbstractIntegrator):
     def send(self, notification_type, scan, task, settings):
@@ -66,7 +71,14 @@ class Integrator(AbstractIntegrator):
 
         payload["blocks"].append({"type": "section", "fields": fields})
 
-        host = urlparse("https://" + request.headers.get("Host"))
+        # Notifications triggered by the detector watcher have no incoming request, and ones sent from
+        # threads of a concurrent poll have the host of the request taken over
+        if has_request_context():
+            host = urlparse("https://" + request.headers.get("Host"))
+        elif g.get("request_host") is not None:
+            host = urlparse("https://" + g.request_host)
+        else:
+            host = urlparse("https://" + app.config["PUBLIC_HOST"])
         scan_url = host._replace(query=scan["uuid"].hex)
         actions = [
             {
@@ -78,4 +90,4 @@ class Integrator(AbstractIntegrator):
 
         payload["blocks"].append({"type": "actions", "elements": actions})
 
-        requests.post(settings["url"], data=json.dumps(payload))
+        requests.post(settings["url"], data=json.dumps(payload), timeout=SLACK_REQUEST_TIMEOUT_IN_SECOND)
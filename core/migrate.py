@@ -0,0 +1,69 @@
+import argparse
+import sys
+
+from app import app
+from models import db
+from models.migrations import explain_query
+from models.migrations import get_schema_version
+from models.migrations import is_full_scan
+from models.migrations import migrate_schema
+from storages import Storage
+from tasks import TaskHandlerBase
+from tasks import TaskProgress
+from tasks.pending import PendingTaskHandler
+from tasks.queue import get_task_count_query
+from tasks.schedule import TaskScheduler
+from utils.scan import get_audit_scans_query
+from utils.scan import get_scan_results_query
+
+
+def get_hot_queries():
+    # Queries issued on every poll or audit view, which must stay indexed as tables grow.
+    # They are built by the same functions as handlers use, so that the checked plans are the actual ones.
+    scheduler = TaskScheduler()
+    storage = Storage()
+    return {
+        "task poll": TaskHandlerBase(TaskProgress.RUNNING.name).get_task_query(),
+        "task target": PendingTaskHandler().get_target_task_query("example.com"),
+        "due scan": scheduler.get_due_scan_query(),
+        "periodic scan": scheduler.get_periodic_scan_query(),
+        "audit scan": get_audit_scans_query(1),
+        "scan result": get_scan_results_query([1]),
+        "scan report": storage.history("0" * 32),
+        "report reference": storage.get_reference_query("0" * 64),
+        "audit task count": get_task_count_query(),
+    }
+
+
+def check_query_plans():
+    full_scans = []
+    for name, query in get_hot_queries().items():
+        plan = explain_query(query)
+        print(" * Query plan of {}: {}".format(name, plan))
+        if is_full_scan(plan):
+            full_scans.append(name)
+    return full_scans
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Migrate database schema of NT-D")
+    parser.add_argument("--check", action="store_true", help="fail if a hot query falls back to a full scan")
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    with app.app_context(), db.database.connection_context():
+        migrate_schema()
+        print(" * Schema version: {}".format(get_schema_version()))
+        if not args.check:
+            return 0
+
+        full_scans = check_query_plans()
+        for name in full_scans:
+            print(" * Full scan: {}".format(name))
+        return 1 if len(full_scans) > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
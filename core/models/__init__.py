@@ -1,10 +1,12 @@
 import uuid
 
 from peewee import SQL
+from peewee import BigIntegerField
 from peewee import BooleanField
 from peewee import CharField
 from peewee import CompositeKey
 from peewee import DateTimeField
+from peewee import FloatField
 from peewee import ForeignKeyField
 from peewee import IntegerField
 from peewee import TextField
@@ -30,6 +32,7 @@ class AuditTable(db.Model):
 class ScanTable(db.Model):
     class Meta:
         db_table = "scan"
+        indexes = ((("task_uuid", "scheduled_at"), False), (("scheduled_at", "next_run_at"), False))
 
     uuid = UUIDField(unique=True)
     audit_id = ForeignKeyField(AuditTable, backref="scans", on_delete="CASCADE", on_update="CASCADE")
@@ -38,11 +41,13 @@ class ScanTable(db.Model):
     target = CharField()
     scheduled_at = DateTimeField(null=True, default=None)
     max_duration = IntegerField(default=0)
+    priority = IntegerField(default=0)
     started_at = DateTimeField(null=True, default=None)
     ended_at = DateTimeField(null=True, default=None)
     error_reason = CharField(default="")
     task_uuid = UUIDField(unique=True, null=True, default=None)
     rrule = CharField(default="")
+    next_run_at = DateTimeField(null=True, default=None)
     detection_module = CharField(default="")
     detection_mode = CharField(default="")
     created_at = DateTimeField(constraints=[SQL("DEFAULT CURRENT_TIMESTAMP")])
@@ -54,12 +59,13 @@ class ScanTable(db.Model):
 class TaskTable(db.Model):
     class Meta:
         db_table = "task"
+        indexes = ((("progress", "updated_at"), False), (("progress", "next_check_at"), False))
 
     uuid = UUIDField(unique=True, default=uuid.uuid4)
     audit_id = ForeignKeyField(AuditTable, null=True, on_delete="SET NULL", on_update="CASCADE")
     scan_id = ForeignKeyField(ScanTable, null=True, on_delete="SET NULL", on_update="CASCADE")
     scan_uuid = UUIDField(null=True, default=None)
-    target = CharField(default="")
+    target = CharField(default="", index=True)
     scheduled_at = DateTimeField(default=None)
     max_duration = IntegerField(default=0)
     started_at = DateTimeField(default=None)
@@ -69,6 +75,9 @@ class TaskTable(db.Model):
     detection_mode = CharField(default="")
     session = TextField(default="")
     progress = CharField(default="")
+    next_check_at = DateTimeField(null=True, default=None)
+    claimed_by = CharField(default="")
+    lease_until = DateTimeField(null=True, default=None)
     results = TextField(default="")
     created_at = DateTimeField(constraints=[SQL("DEFAULT CURRENT_TIMESTAMP")])
     updated_at = DateTimeField(constraints=[SQL("DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP")])
@@ -90,6 +99,18 @@ class ResultTable(db.Model):
     updated_at = DateTimeField(constraints=[SQL("DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP")])
 
 
+class ReportTable(db.Model):
+    class Meta:
+        db_table = "report"
+        indexes = ((("scan_uuid", "created_at"), False),)
+
+    scan_uuid = UUIDField()
+    task_uuid = UUIDField(null=True, index=True)
+    digest = CharField(max_length=64, index=True)
+    size = BigIntegerField(default=0)
+    created_at = DateTimeField(constraints=[SQL("DEFAULT CURRENT_TIMESTAMP")])
+
+
 class IntegrationTable(db.Model):
     class Meta:
         db_table = "integration"
@@ -99,3 +120,33 @@ class IntegrationTable(db.Model):
     service = CharField(null=True)
     url = CharField(null=True)
     verbose = BooleanField(default=False)
+
+
+class DurationTable(db.Model):
+    class Meta:
+        db_table = "duration"
+        primary_key = CompositeKey("detection_module", "target")
+
+    detection_module = CharField()
+    target = CharField()
+    duration = FloatField(default=0)
+    count = IntegerField(default=0)
+    updated_at = DateTimeField(constraints=[SQL("DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP")])
+
+
+class CursorTable(db.Model):
+    class Meta:
+        db_table = "cursor"
+
+    progress = CharField(primary_key=True)
+    task_updated_at = DateTimeField()
+    task_id = IntegerField()
+
+
+class SchemaVersionTable(db.Model):
+    class Meta:
+        db_table = "schema_version"
+
+    version = IntegerField(unique=True)
+    description = CharField(default="")
+    applied_at = DateTimeField(constraints=[SQL("DEFAULT CURRENT_TIMESTAMP")])
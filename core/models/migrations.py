@@ -0,0 +1,118 @@
+from flask import current_app as app
+from playhouse.migrate import MySQLMigrator
+from playhouse.migrate import migrate
+
+from models import ReportTable
+from models import ResultTable
+from models import ScanTable
+from models import SchemaVersionTable
+from models import TaskTable
+from models import db
+from utils.schedule import backfill_next_run_at
+
+MIGRATION_LOCK_NAME = "ntd_schema_migration"
+MIGRATION_LOCK_TIMEOUT_IN_SECOND = 600
+
+
+def add_missing_columns(tables):
+    # `create_tables` never alters existing tables, so columns added to models later are added here
+    migrator = MySQLMigrator(db.database)
+    operations = []
+    for table in tables:
+        table_name = table._meta.table_name
+        columns = [column.name for column in db.database.get_columns(table_name)]
+        for field in table._meta.sorted_fields:
+            if field.column_name not in columns:
+                operations.append(migrator.add_column(table_name, field.column_name, field))
+    migrate(*operations)
+
+
+def add_missing_indexes(tables):
+    # Indexes are built in place without locking the table, so that tasks keep being processed meanwhile
+    for table in tables:
+        table_name = table._meta.table_name
+        indexes = [index.columns for index in db.database.get_indexes(table_name)]
+        for index in table._meta.fields_to_index():
+            columns = [field.column_name for field in index._expressions]
+            if columns in indexes:
+                continue
+            app.logger.info("Try to add index: table={}, columns={}".format(table_name, columns))
+            db.database.execute_sql(
+                "ALTER TABLE `{}` ADD {}INDEX `{}` ({}), ALGORITHM=INPLACE, LOCK=NONE".format(
+                    table_name,
+                    "UNIQUE " if index._unique else "",
+                    index._name,
+                    ", ".join(["`{}`".format(column) for column in columns]),
+                )
+            )
+            app.logger.info("Added index successfully: table={}, columns={}".format(table_name, columns))
+
+
+def add_scan_schedule_columns():
+    add_missing_columns([ScanTable])
+
+
+def add_hot_query_indexes():
+    add_missing_indexes([TaskTable, ScanTable, ResultTable])
+
+
+def add_task_next_check_column():
+    add_missing_columns([TaskTable])
+    add_missing_indexes([TaskTable])
+
+
+def add_task_lease_columns():
+    add_missing_columns([TaskTable])
+
+
+def add_report_task_column():
+    add_missing_columns([ReportTable])
+    add_missing_indexes([ReportTable])
+
+
+# Migrations must be idempotent because databases migrated before versioning have some of them applied
+MIGRATIONS = [
+    (1, "Add priority and next_run_at columns to scan", add_scan_schedule_columns),
+    (2, "Backfill next_run_at of periodic scans", backfill_next_run_at),
+    (3, "Add indexes for hot queries", add_hot_query_indexes),
+    (4, "Add next_check_at column to task", add_task_next_check_column),
+    (5, "Add claimed_by and lease_until columns to task", add_task_lease_columns),
+    (6, "Add task_uuid column to report", add_report_task_column),
+]
+
+
+def get_schema_version():
+    return max([version.version for version in SchemaVersionTable.select()] or [0])
+
+
+def migrate_schema():
+    # Lock prevents app instances starting at the same time from running the same migration
+    cursor = db.database.execute_sql(
+        "SELECT GET_LOCK(%s, %s)", (MIGRATION_LOCK_NAME, MIGRATION_LOCK_TIMEOUT_IN_SECOND)
+    )
+    if cursor.fetchone()[0] != 1:
+        raise Exception("Could not acquire schema migration lock")
+
+    try:
+        applied_versions = [version.version for version in SchemaVersionTable.select()]
+        for version, description, migration in MIGRATIONS:
+            if version in applied_versions:
+                continue
+            app.logger.info("Try to migrate schema: version={}, description={}".format(version, description))
+            migration()
+            SchemaVersionTable.create(version=version, description=description)
+            app.logger.info("Migrated schema successfully: version={}".format(version))
+    finally:
+        db.database.execute_sql("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK_NAME,))
+
+
+def explain_query(query):
+    sql, params = query.sql()
+    cursor = db.database.execute_sql("EXPLAIN " + sql, params)
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def is_full_scan(plan):
+    # Optimizer may still read small tables entirely, so only tables without any usable index are reported
+    return any([row["type"] == "ALL" and row["possible_keys"] is None for row in plan])
@@ -1,39 +1,345 @@
-import os
+import concurrent.futures
+import gzip
+import hashlib
+import importlib
+import io
+import shutil
+import tempfile
+import threading
+import time
+import zlib
+from abc import ABCMeta
+from abc import abstractmethod
+from contextlib import contextmanager
 
-from google.cloud import storage
+from flask import current_app as app
 
-from utils import Utils
+from models import ReportTable
+from models import ScanTable
+from models import db
+from utils import metrics
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+STORAGE_CHUNK_SIZE = 2 ** 20
+STORAGE_SPOOL_SIZE = 2 ** 24
+STORAGE_UPLOAD_BACKOFF_IN_SECOND = 1
+REPORT_LOCK_TIMEOUT_IN_SECOND = 60
+
+
+class Codec:
+
+    ENCODING = "identity"
+
+    def compress(self, src, dst):
+        shutil.copyfileobj(src, dst, STORAGE_CHUNK_SIZE)
+
+    def decompressobj(self):
+        return None
+
+
+class GzipCodec(Codec):
+
+    ENCODING = "gzip"
+
+    def compress(self, src, dst):
+        with gzip.GzipFile(fileobj=dst, mode="wb") as f:
+            shutil.copyfileobj(src, f, STORAGE_CHUNK_SIZE)
+
+    def decompressobj(self):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+
+class ZstdCodec(Codec):
+
+    ENCODING = "zstd"
+
+    def compress(self, src, dst):
+        compressor = zstandard.ZstdCompressor().compressobj()
+        for chunk in iter(lambda: src.read(STORAGE_CHUNK_SIZE), b""):
+            dst.write(compressor.compress(chunk))
+        dst.write(compressor.flush())
+
+    def decompressobj(self):
+        return zstandard.ZstdDecompressor().decompressobj()
+
+
+def get_codec(encoding):
+    if encoding == GzipCodec.ENCODING:
+        return GzipCodec()
+    if encoding == ZstdCodec.ENCODING:
+        if zstandard is None:
+            raise ValueError("zstandard is not installed")
+        return ZstdCodec()
+    return Codec()
+
+
+class AbstractReport(metaclass=ABCMeta):
+    def __init__(self, encoding, size, uncompressed_size, path=None):
+        self.codec = get_codec(encoding)
+        self.encoding = self.codec.ENCODING
+        self.size = size
+        self.uncompressed_size = uncompressed_size
+        # Reports on a local disk can be sent by the web server without going through the worker
+        self.path = path
+
+    @abstractmethod
+    def iter_raw(self, start=0, stop=None):
+        return
+
+    def iter_decoded(self, start=0, stop=None):
+        stop = self.uncompressed_size if stop is None else stop
+        decompressor = self.codec.decompressobj()
+        if decompressor is None:
+            yield from self.iter_raw(start, stop)
+            return
+
+        # Compressed streams cannot be seeked, so decompress from the head and skip bytes before the range
+        offset = 0
+        for chunk in self.iter_raw():
+            data = decompressor.decompress(chunk)
+            sliced = data[max(0, start - offset) : max(0, stop - offset)]
+            offset += len(data)
+            if len(sliced) > 0:
+                yield sliced
+            if offset >= stop:
+                return
+
+
+class AbstractStorageBackend(metaclass=ABCMeta):
+    @abstractmethod
+    def put(self, key, f, encoding, uncompressed_size):
+        return
+
+    @abstractmethod
+    def get(self, key):
+        return
+
+    @abstractmethod
+    def exists(self, key):
+        return
+
+    @abstractmethod
+    def delete(self, key):
+        return
+
+    @abstractmethod
+    def delete_prefix(self, prefix):
+        return
+
+
+backends = {}
+backends_lock = threading.Lock()
+
+
+def get_backend(name):
+    # Backends hold clients and connections, so they are created once and shared by threads in the process
+    with backends_lock:
+        if name not in backends:
+            # Backends are modules in this package, e.g., "gcs" for storages/gcs.py
+            module = importlib.import_module("storages.{}".format(name))
+            backends[name] = module.StorageBackend()
+        return backends[name]
+
+
+@contextmanager
+def report_lock(digest):
+    # Lock serializes storing and collecting the same report across processes, so that a report referred just
+    # now is never deleted as unreferenced. Lock names are limited to 64 characters.
+    name = "ntd_report_{}".format(digest[0:48])
+    cursor = db.database.execute_sql("SELECT GET_LOCK(%s, %s)", (name, REPORT_LOCK_TIMEOUT_IN_SECOND))
+    if cursor.fetchone()[0] != 1:
+        raise Exception("Could not acquire report lock: digest={}".format(digest))
+    try:
+        yield
+    finally:
+        db.database.execute_sql("SELECT RELEASE_LOCK(%s)", (name,))
 
 
 class Storage:
 
     RESULTS_DIR = "results"
+    REPORTS_DIR = "reports"
 
     def __init__(self):
-        if Utils.is_gcp():
-            self.client = storage.Client(project=os.environ["GCP_PROJECT_ID"])
-            self.bucket = self.client.get_bucket(os.environ["BUCKET_NAME"])
+        self.backend = get_backend(app.config["STORAGE_BACKEND"])
 
-    def store(self, uuid, data):
-        if Utils.is_gcp():
-            blob = self.bucket.blob(self._get_key_from_uuid(uuid))
-            blob.upload_from_string(data)
-        return
+    @metrics.measure(metrics.storage_operation_seconds, operation="store")
+    def store(self, uuid, data, task_uuid=None):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        if isinstance(data, bytes):
+            data = io.BytesIO(data)
+        data.seek(0)
+
+        # Reports are addressed by their content, so identical reports of recurring scans are stored once
+        digest = hashlib.sha256()
+        for chunk in iter(lambda: data.read(STORAGE_CHUNK_SIZE), b""):
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        size = data.tell()
+
+        # Reference is committed before the report lock is released, so it cannot join an outer transaction
+        if db.database.in_transaction():
+            raise Exception("Report cannot be stored within a transaction: uuid={}".format(uuid))
+
+        with report_lock(digest):
+            key = self._get_key_from_digest(digest)
+            if self.backend.exists(key):
+                app.logger.info("Report already stored: uuid={}, digest={}".format(uuid, digest))
+            else:
+                # Reports are compressed through a spooled file without reading them at once
+                codec = get_codec(app.config["STORAGE_COMPRESSION"])
+                with tempfile.SpooledTemporaryFile(max_size=STORAGE_SPOOL_SIZE) as compressed:
+                    data.seek(0)
+                    codec.compress(data, compressed)
+                    compressed.seek(0)
+                    self.backend.put(key, compressed, codec.ENCODING, size)
+            referred = self.refer(uuid, task_uuid, digest, size)
+
+        if not referred:
+            self.collect([digest])
+            return None
+        self.prune(uuid)
+        return digest
+
+    def refer(self, uuid, task_uuid, digest, size):
+        with db.database.atomic():
+            # Scan is locked until the reference is committed, so that a scan deleted meanwhile leaves no ref
+            scan_query = ScanTable.select().where(ScanTable.uuid == uuid).for_update("LOCK IN SHARE MODE")
+            if not scan_query.exists():
+                app.logger.info("Scan has been deleted: uuid={}".format(uuid))
+                return False
+
+            # Report of a task may be uploaded again when the task is retried, but it is referred only once
+            if task_uuid is not None and self.exists(task_uuid):
+                app.logger.info("Report already referred: uuid={}, task={}".format(uuid, task_uuid))
+                return True
+            ReportTable.create(scan_uuid=uuid, task_uuid=task_uuid, digest=digest, size=size)
+            return True
+
+    @metrics.measure(metrics.storage_operation_seconds, operation="load")
+    def load(self, uuid, digest=None):
+        report_query = ReportTable.select().where(ReportTable.scan_uuid == uuid)
+        if digest is not None:
+            report_query = report_query.where(ReportTable.digest == digest)
+        report = report_query.order_by(ReportTable.created_at.desc(), ReportTable.id.desc()).first()
+        if report is not None:
+            return self.backend.get(self._get_key_from_digest(report.digest))
+        if digest is not None:
+            return None
+
+        # Reports stored before deduplication was introduced are kept under the scan UUID
+        return self.backend.get(self._get_key_from_uuid(uuid))
+
+    def exists(self, task_uuid):
+        return ReportTable.select().where(ReportTable.task_uuid == task_uuid).exists()
 
-    def load(self, uuid):
-        if Utils.is_gcp():
-            blob = self.bucket.get_blob(self._get_key_from_uuid(uuid))
-            if blob is None:
-                return {}
-            return blob.download_as_string().decode("utf-8")
-        else:
-            return "__report__"
+    def history(self, uuid):
+        report_query = ReportTable.select().where(ReportTable.scan_uuid == uuid)
+        return report_query.order_by(ReportTable.created_at.desc(), ReportTable.id.desc()).dicts()
 
+    def get_reference_query(self, digest):
+        return ReportTable.select().where(ReportTable.digest == digest)
+
+    def prune(self, uuid):
+        history_size = app.config["STORAGE_REPORT_HISTORY_SIZE"]
+        if history_size <= 0:
+            return
+
+        stale_reports = list(self.history(uuid).offset(history_size))
+        if len(stale_reports) > 0:
+            ReportTable.delete().where(ReportTable.id << [r["id"] for r in stale_reports]).execute()
+            self.collect(set([r["digest"] for r in stale_reports]))
+
+    def collect(self, digests):
+        for digest in digests:
+            with report_lock(digest):
+                if self.get_reference_query(digest).exists():
+                    continue
+                self.backend.delete(self._get_key_from_digest(digest))
+                app.logger.info("Deleted unreferenced report successfully: digest={}".format(digest))
+
+    @metrics.measure(metrics.storage_operation_seconds, operation="delete")
     def delete(self, directory):
-        if Utils.is_gcp():
-            prefix = "{}/{}/".format(self.RESULTS_DIR, directory[0:24])
-            self.bucket.delete_blobs(blobs=self.bucket.list_blobs(prefix=prefix))
+        # Scan UUIDs share the first 24 characters with their audit UUID
+        prefix = directory[0:24]
+        report_query = ReportTable.select(ReportTable.digest).where(ReportTable.scan_uuid.startswith(prefix))
+        digests = set([report["digest"] for report in report_query.dicts()])
+        ReportTable.delete().where(ReportTable.scan_uuid.startswith(prefix)).execute()
+        self.collect(digests)
+        self.backend.delete_prefix("{}/{}/".format(self.RESULTS_DIR, prefix))
+        return
+
+    @metrics.measure(metrics.storage_operation_seconds, operation="delete")
+    def delete_scan(self, uuid):
+        report_query = ReportTable.select(ReportTable.digest).where(ReportTable.scan_uuid == uuid)
+        digests = set([report["digest"] for report in report_query.dicts()])
+        ReportTable.delete().where(ReportTable.scan_uuid == uuid).execute()
+        self.collect(digests)
+        self.backend.delete(self._get_key_from_uuid(uuid))
         return
 
     def _get_key_from_uuid(self, uuid):
         return "{}/{}/{}".format(self.RESULTS_DIR, uuid[0:24], uuid[24:])
+
+    def _get_key_from_digest(self, digest):
+        return "{}/{}/{}".format(self.REPORTS_DIR, digest[0:2], digest)
+
+
+class Uploader:
+    def __init__(self):
+        self.executor = None
+        self.futures = {}
+        self.lock = threading.Lock()
+
+    def submit(self, uuid, data, task_uuid=None):
+        flask_app = app._get_current_object()
+        with self.lock:
+            if self.executor is None:
+                self.executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=app.config["STORAGE_UPLOAD_CONCURRENCY"]
+                )
+            future = self.executor.submit(self.upload, flask_app, uuid, data, task_uuid)
+            self.futures[future] = task_uuid
+            metrics.storage_pending_uploads.set(len(self.futures))
+        future.add_done_callback(self.done)
+        return future
+
+    def upload(self, flask_app, uuid, data, task_uuid=None):
+        # Uploader owns the report from here, and closes it once the upload succeeds or gives up
+        with flask_app.app_context(), db.database.connection_context():
+            try:
+                retries = app.config["STORAGE_UPLOAD_RETRIES"]
+                for attempt in range(retries + 1):
+                    try:
+                        Storage().store(uuid, data, task_uuid)
+                        app.logger.info("Uploaded report successfully: uuid={}".format(uuid))
+                        return True
+                    except Exception as error:
+                        app.logger.warn("ERROR: uuid={}, attempt={}, error={}".format(uuid, attempt, error))
+                        if attempt < retries:
+                            time.sleep(STORAGE_UPLOAD_BACKOFF_IN_SECOND * 2 ** attempt)
+                metrics.storage_upload_errors.inc()
+                return False
+            finally:
+                data.close()
+
+    def done(self, future):
+        with self.lock:
+            self.futures.pop(future)
+            metrics.storage_pending_uploads.set(len(self.futures))
+
+    def is_pending(self, task_uuid):
+        with self.lock:
+            return task_uuid in self.futures.values()
+
+    def wait(self, futures, timeout=None):
+        _, not_done = concurrent.futures.wait(futures, timeout=timeout)
+        return len(not_done)
+
+
+uploader = Uploader()
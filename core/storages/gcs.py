@@ -0,0 +1,59 @@
+import os
+
+from google.api_core.exceptions import NotFound
+from google.cloud import storage
+
+from storages import STORAGE_CHUNK_SIZE
+from storages import AbstractReport
+from storages import AbstractStorageBackend
+from storages import Codec
+
+UNCOMPRESSED_SIZE_METADATA = "uncompressed-size"
+
+
+class Report(AbstractReport):
+    def __init__(self, blob):
+        # Reports stored before compression was introduced have no metadata and are served as they are
+        metadata = blob.metadata or {}
+        uncompressed_size = int(metadata.get(UNCOMPRESSED_SIZE_METADATA, blob.size))
+        super().__init__(blob.content_encoding, blob.size, uncompressed_size)
+        self.blob = blob
+
+    def iter_raw(self, start=0, stop=None):
+        # Download in ranged chunks, so that a worker never holds the whole report in memory
+        stop = self.size if stop is None else stop
+        for offset in range(start, stop, STORAGE_CHUNK_SIZE):
+            end = min(offset + STORAGE_CHUNK_SIZE, stop) - 1
+            yield self.blob.download_as_string(start=offset, end=end, raw_download=True)
+
+
+class StorageBackend(AbstractStorageBackend):
+    def __init__(self):
+        self.client = storage.Client(project=os.environ["GCP_PROJECT_ID"])
+        # Bucket is referred without fetching its metadata, which saves an API call
+        self.bucket = self.client.bucket(os.environ["BUCKET_NAME"])
+
+    def put(self, key, f, encoding, uncompressed_size):
+        blob = self.bucket.blob(key)
+        if encoding != Codec.ENCODING:
+            blob.content_encoding = encoding
+        blob.metadata = {UNCOMPRESSED_SIZE_METADATA: str(uncompressed_size)}
+        blob.upload_from_file(f, rewind=True, content_type="text/plain")
+
+    def get(self, key):
+        blob = self.bucket.get_blob(key)
+        if blob is None:
+            return None
+        return Report(blob)
+
+    def exists(self, key):
+        return self.bucket.blob(key).exists()
+
+    def delete(self, key):
+        try:
+            self.bucket.delete_blob(key)
+        except NotFound:
+            pass
+
+    def delete_prefix(self, prefix):
+        self.bucket.delete_blobs(blobs=self.bucket.list_blobs(prefix=prefix))
@@ -0,0 +1,92 @@
+import io
+import mmap
+import os
+import shutil
+import tempfile
+
+from flask import current_app as app
+
+from storages import STORAGE_CHUNK_SIZE
+from storages import AbstractReport
+from storages import AbstractStorageBackend
+from utils import serializer
+
+METADATA_SUFFIX = ".meta"
+
+
+class Report(AbstractReport):
+    def __init__(self, path, encoding, uncompressed_size):
+        super().__init__(encoding, os.path.getsize(path), uncompressed_size, path)
+
+    def iter_raw(self, start=0, stop=None):
+        stop = self.size if stop is None else stop
+        if start >= stop:
+            return
+
+        # Pages are read by the kernel on demand, so a worker never copies the whole report into memory
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            for offset in range(start, stop, STORAGE_CHUNK_SIZE):
+                yield m[offset : min(offset + STORAGE_CHUNK_SIZE, stop)]
+
+
+class StorageBackend(AbstractStorageBackend):
+    def __init__(self):
+        self.root = os.path.realpath(app.config["STORAGE_LOCAL_ROOT"])
+
+    def put(self, key, f, encoding, uncompressed_size):
+        path = self._get_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        size = f.seek(0, io.SEEK_END)
+        f.seek(0)
+        metadata = serializer.dumps(
+            {"encoding": encoding, "uncompressed_size": uncompressed_size, "size": size}
+        )
+        # Metadata goes first, so that a report is never visible without the metadata describing it
+        self._replace(path + METADATA_SUFFIX, io.BytesIO(metadata.encode("utf-8")))
+        self._replace(path, f)
+
+    def get(self, key):
+        path = self._get_path(key)
+        if not os.path.isfile(path):
+            return None
+
+        # Metadata is written before the report, so a report without it has not been stored properly
+        if not os.path.isfile(path + METADATA_SUFFIX):
+            raise Exception("Report has no metadata: key={}".format(key))
+        with open(path + METADATA_SUFFIX, "rb") as f:
+            metadata = serializer.load(f)
+        # Metadata of a report being replaced may not describe the report on disk yet
+        if metadata["size"] != os.path.getsize(path):
+            raise Exception("Report does not match its metadata: key={}".format(key))
+        return Report(path, metadata["encoding"], metadata["uncompressed_size"])
+
+    def exists(self, key):
+        return os.path.isfile(self._get_path(key))
+
+    def delete(self, key):
+        path = self._get_path(key)
+        for p in [path, path + METADATA_SUFFIX]:
+            if os.path.isfile(p):
+                os.remove(p)
+
+    def delete_prefix(self, prefix):
+        shutil.rmtree(self._get_path(prefix), ignore_errors=True)
+
+    def _get_path(self, key):
+        path = os.path.realpath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError("Key is out of storage: key={}".format(key))
+        return path
+
+    def _replace(self, path, f):
+        # Rename a temporary file in the same directory, so that readers never see a partially written file
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".")
+        try:
+            with os.fdopen(fd, "wb") as temp:
+                shutil.copyfileobj(f, temp, STORAGE_CHUNK_SIZE)
+                temp.flush()
+                os.fsync(temp.fileno())
+            os.replace(temp_path, path)
+        except Exception:
+            os.remove(temp_path)
+            raise
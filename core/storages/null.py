@@ -0,0 +1,31 @@
+from storages import AbstractReport
+from storages import AbstractStorageBackend
+from storages import Codec
+
+NULL_REPORT = b"__report__"
+
+
+class Report(AbstractReport):
+    def __init__(self, data):
+        super().__init__(Codec.ENCODING, len(data), len(data))
+        self.data = data
+
+    def iter_raw(self, start=0, stop=None):
+        yield self.data[start:stop]
+
+
+class StorageBackend(AbstractStorageBackend):
+    def put(self, key, f, encoding, uncompressed_size):
+        return
+
+    def get(self, key):
+        return Report(NULL_REPORT)
+
+    def exists(self, key):
+        return False
+
+    def delete(self, key):
+        return
+
+    def delete_prefix(self, prefix):
+        return
@@ -1,3 +1,8 @@
+import concurrent.futures
+import os
+import socket
+import time
+import uuid
 from datetime import datetime
 from datetime import timedelta
 from enum import Enum
@@ -5,14 +10,21 @@ from enum import unique
 
 import pytz
 from flask import current_app as app
+from flask import g
+from flask import has_request_context
+from flask import request
 from peewee import JOIN
 
 from detectors import dtm
 from integrators import NotificationType
 from integrators import im
+from models import CursorTable
 from models import ScanTable
 from models import TaskTable
 from models import db
+from utils import metrics
+
+TASK_JOIN_TIMEOUT_IN_SECOND = 5
 
 
 @unique
@@ -26,36 +38,192 @@ class TaskHandlerBase:
     def __init__(self, progress):
         self.now = datetime.now(tz=pytz.utc)
         self.progress = progress
+        self.pods = {}
 
     def add(self, task):
         return
 
-    def poll(self):
+    def poll(self, task_uuid=None):
+        tasks = self.resume(list(self.get_task_query(task_uuid).dicts()))
+        self.prefetch(tasks)
+
+        # Tasks left over when the time budget runs out are handled first in the next poll
+        started_at = time.perf_counter()
+        deadline = time.monotonic() + app.config["TASK_POLL_BUDGET_IN_SECOND"]
+        if app.config["TASK_POLL_CONCURRENCY"] > 1 and len(tasks) > 1:
+            remaining_tasks = self.handle_concurrently(tasks, deadline)
+        else:
+            remaining_tasks = self.handle_sequentially(tasks, deadline)
+        if task_uuid is None:
+            self.save_cursor(remaining_tasks[0] if len(remaining_tasks) > 0 else None)
+        metrics.task_poll_seconds.observe(time.perf_counter() - started_at, progress=self.progress)
+
+    def get_task_query(self, task_uuid=None):
         # Get all task entries that progress matches the task queue name, e.g., PENDING.
         task_query = (
             TaskTable.select(TaskTable, ScanTable.uuid.alias("scan_exists"))
             .join(ScanTable, JOIN.LEFT_OUTER, on=(TaskTable.uuid == ScanTable.task_uuid))
             .where(TaskTable.progress == self.progress)
-            .order_by(TaskTable.updated_at.asc())
+            .order_by(TaskTable.updated_at.asc(), TaskTable.id.asc())
         )
-        for task in task_query.dicts():
-            try:
-                # Task UUID changes if the task is cancelled/rescheduled by user.
-                # Here we cancel a task that is no longer connected to any scan entries.
-                if task.pop("scan_exists") is None:
-                    raise Exception("Cancelled: scan has been cancelled/rescheduled by user")
-
-                # Cancel the task if that scan period has already elapsed
-                scheduled_at = task["scheduled_at"].replace(tzinfo=pytz.utc)
-                if self.now > (scheduled_at + timedelta(hours=task["max_duration"])):
-                    raise Exception("Cancelled: scheduled period has elapsed")
-
-                # Call task process function prepared by each handler
-                app.logger.info("Do process: task={}".format(task["uuid"]))
-                self.process(task)
-            except Exception as error:
-                app.logger.warn("ERROR: task={}, error={}".format(task["uuid"], error))
-                self.finish(task, error)
+        # Only the specified task is handled when the poll is triggered by a detector event
+        if task_uuid is not None:
+            task_query = task_query.where(TaskTable.uuid == task_uuid)
+        else:
+            task_query = task_query.where(
+                TaskTable.next_check_at.is_null() | (TaskTable.next_check_at <= self.now)
+            )
+        return task_query
+
+    def resume(self, tasks):
+        cursor = CursorTable.get_or_none(CursorTable.progress == self.progress)
+        if cursor is None:
+            return tasks
+
+        # Start from the task where the last poll stopped, and wrap around to the tasks before it
+        position = (cursor.task_updated_at, cursor.task_id)
+        index = len([task for task in tasks if (task["updated_at"], task["id"]) < position])
+        app.logger.info("Resume poll: progress={}, skipped={}".format(self.progress, index))
+        return tasks[index:] + tasks[:index]
+
+    def save_cursor(self, task):
+        if task is None:
+            CursorTable.delete().where(CursorTable.progress == self.progress).execute()
+            return
+
+        app.logger.info("Time budget exhausted: progress={}, next={}".format(self.progress, task["uuid"]))
+        cursor = {"progress": self.progress, "task_updated_at": task["updated_at"], "task_id": task["id"]}
+        CursorTable.insert(cursor).on_conflict(
+            update={CursorTable.task_updated_at: task["updated_at"], CursorTable.task_id: task["id"]}
+        ).execute()
+
+    def handle_sequentially(self, tasks, deadline):
+        for index, task in enumerate(tasks):
+            if time.monotonic() > deadline:
+                return tasks[index:]
+            self.handle(task)
+        return []
+
+    def handle(self, task):
+        # Task is leased before processing and no transaction is held meanwhile, so other workers neither
+        # process it twice nor wait for it
+        try:
+            claimed_task = self.claim(task)
+        except Exception as error:
+            app.logger.warn("ERROR: task={}, error={}".format(task["uuid"], error))
+            return
+        if claimed_task is None:
+            app.logger.info("Skipped: task={} has been processed by another worker".format(task["uuid"]))
+            return
+
+        task.update(claimed_task)
+        try:
+            self.handle_claimed(task)
+        finally:
+            self.release(task)
+
+    def handle_claimed(self, task):
+        started_at = time.perf_counter()
+        try:
+            # Task UUID changes if the task is cancelled/rescheduled by user.
+            # Here we cancel a task that is no longer connected to any scan entries.
+            if task.pop("scan_exists") is None:
+                raise Exception("Cancelled: scan has been cancelled/rescheduled by user")
+
+            # Cancel the task if that scan period has already elapsed
+            scheduled_at = task["scheduled_at"].replace(tzinfo=pytz.utc)
+            if self.now > (scheduled_at + timedelta(hours=task["max_duration"])):
+                raise Exception("Cancelled: scheduled period has elapsed")
+
+            # Call task process function prepared by each handler
+            app.logger.info("Do process: task={}".format(task["uuid"]))
+            self.process(task)
+        except Exception as error:
+            app.logger.warn("ERROR: task={}, error={}".format(task["uuid"], error))
+            metrics.task_errors.inc(progress=self.progress)
+            self.finish(task, error)
+        finally:
+            metrics.task_process_seconds.observe(time.perf_counter() - started_at, progress=self.progress)
+
+    def handle_concurrently(self, tasks, deadline):
+        flask_app = app._get_current_object()
+        timeout = app.config["TASK_PROCESS_TIMEOUT_IN_SECOND"]
+        started_at = {}
+
+        # Request context cannot be shared by threads, so only the request data they need is taken over
+        request_host = request.headers.get("Host") if has_request_context() else None
+
+        def handle(task):
+            started_at[task["uuid"]] = time.monotonic()
+            # Each worker thread needs its own app context and database connection
+            with flask_app.app_context(), db.database.connection_context():
+                g.request_host = request_host
+                self.handle(task)
+
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=app.config["TASK_POLL_CONCURRENCY"])
+        futures = dict([(executor.submit(handle, task), task) for task in tasks])
+        not_done = set(futures.keys())
+        while len(not_done) > 0:
+            done, not_done = concurrent.futures.wait(
+                not_done, timeout=1, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                if future.exception() is not None:
+                    app.logger.error(
+                        "ERROR: task={}, error={}".format(futures[future]["uuid"], future.exception())
+                    )
+
+            # Tasks running beyond the timeout are not waited for, and the other tasks keep being handled
+            expired = [
+                future
+                for future in not_done
+                if futures[future]["uuid"] in started_at
+                and time.monotonic() > started_at[futures[future]["uuid"]] + timeout
+            ]
+            for future in expired:
+                app.logger.warn("ERROR: task={}, error=Timed out".format(futures[future]["uuid"]))
+                not_done.remove(future)
+
+            # Tasks not started yet are left to the next poll once the budget runs out
+            if time.monotonic() > deadline:
+                for future in not_done:
+                    future.cancel()
+                break
+
+        # Threads cannot be interrupted, so running ones are waited for only a little while. A thread left
+        # behind ends by itself since every external call in it has a timeout, and its task stays leased.
+        running = [future for future in futures if not future.done()]
+        if len(running) > 0:
+            concurrent.futures.wait(running, timeout=TASK_JOIN_TIMEOUT_IN_SECOND)
+        executor.shutdown(wait=False)
+        return [task for future, task in futures.items() if future.cancelled()]
+
+    def claim(self, task):
+        # Conditional update is atomic and committed at once, so only one worker gets the lease.
+        # Lease of a worker which has died expires, and the task is claimed again.
+        now = datetime.now(tz=pytz.utc)
+        lease = {
+            "claimed_by": "{}:{}:{}".format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[0:8]),
+            "lease_until": now + timedelta(seconds=app.config["TASK_LEASE_IN_SECOND"]),
+        }
+        claimed = (
+            TaskTable.update(lease)
+            .where((TaskTable.uuid == task["uuid"]) & (TaskTable.progress == self.progress))
+            .where(TaskTable.lease_until.is_null() | (TaskTable.lease_until < now))
+            .execute()
+        )
+        if claimed == 0:
+            return None
+        return TaskTable.select().where(TaskTable.uuid == task["uuid"]).dicts().first()
+
+    def release(self, task):
+        try:
+            TaskTable.update({"claimed_by": "", "lease_until": None}).where(
+                (TaskTable.uuid == task["uuid"]) & (TaskTable.claimed_by == task["claimed_by"])
+            ).execute()
+        except Exception as error:
+            # Lease expires anyway, so the task is only delayed
+            app.logger.warn("ERROR: task={}, error={}".format(task["uuid"], error))
 
     def finish(self, task, error_reason=""):
         app.logger.info("Try to delete: task={}, error_reason={}".format(task, error_reason))
@@ -75,5 +243,25 @@ class TaskHandlerBase:
 
         app.logger.info("Deleted successfully: task={}, error_reason={}".format(task["uuid"], error_reason))
 
+    def prefetch(self, tasks):
+        pass
+
+    def observe_phase(self, progress, since):
+        elapsed = (self.now - since.replace(tzinfo=pytz.utc)).total_seconds()
+        metrics.task_phase_seconds.observe(elapsed, progress=progress)
+
+    def get_detector_pods(self, tasks):
+        # Pods handed off by the watcher are reused, and only modules of the other tasks are listed
+        pods = dict(self.pods)
+        tasks = [task for task in tasks if task["uuid"].hex not in pods]
+
+        # Fetch pods by one API call per detection module instead of one call per task
+        for module in set([task["detection_module"] for task in tasks]):
+            try:
+                pods.update(dtm.load_detector(module, None).get_pods())
+            except Exception as error:
+                app.logger.warn("ERROR: module={}, error={}".format(module, error))
+        return pods
+
     def process(self, task):
         pass
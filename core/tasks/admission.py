@@ -0,0 +1,156 @@
+import re
+from decimal import Decimal
+
+from flask import current_app as app
+
+from detectors import DETECTOR_POD_LABEL
+from detectors import ExecutionMode
+from detectors import PodPoolState
+from detectors import dtm
+from detectors import kcm
+
+RESOURCES = ["cpu", "memory"]
+QUANTITY_SUFFIXES = {
+    "Ki": 2 ** 10,
+    "Mi": 2 ** 20,
+    "Gi": 2 ** 30,
+    "Ti": 2 ** 40,
+    "Pi": 2 ** 50,
+    "Ei": 2 ** 60,
+    "n": Decimal("1e-9"),
+    "u": Decimal("1e-6"),
+    "m": Decimal("1e-3"),
+    "": 1,
+    "k": 10 ** 3,
+    "M": 10 ** 6,
+    "G": 10 ** 9,
+    "T": 10 ** 12,
+    "P": 10 ** 15,
+    "E": 10 ** 18,
+}
+# Quantities are a decimal number followed by a binary SI suffix, a decimal SI suffix or a decimal exponent,
+# e.g., "128Mi", "0.5", "500m" or "1e3"
+QUANTITY_PATTERN = re.compile(r"^([+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+))(Ki|Mi|Gi|Ti|Pi|Ei|n|u|m|k|M|G|T|P|E|)$")
+QUANTITY_EXPONENT_PATTERN = re.compile(r"^([+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+))[eE]([+-]?[0-9]+)$")
+
+
+def parse_quantity(quantity):
+    quantity = str(quantity).strip()
+    match = QUANTITY_EXPONENT_PATTERN.match(quantity)
+    if match is not None:
+        return Decimal(match.group(1)).scaleb(int(match.group(2)))
+    match = QUANTITY_PATTERN.match(quantity)
+    if match is None:
+        raise ValueError("Invalid quantity: {}".format(quantity))
+    return Decimal(match.group(1)) * QUANTITY_SUFFIXES[match.group(2)]
+
+
+class AdmissionController:
+    def __init__(self):
+        self.core_api = kcm.get_core_api()
+        self.budget = self.get_budget()
+        self.used = self.get_empty_resources()
+        self.task_counts = {}
+        self.idle_pod_counts = {}
+
+        # Pending pods are counted as well because they will take capacity once they are scheduled
+        tasks = {}
+        for pod in self.get_detector_pods():
+            self.add_resources(self.used, self.get_pod_requests(pod))
+            labels = pod.metadata.labels or {}
+            module = labels.get("module")
+            if "task" in labels:
+                tasks.setdefault(module, set()).add(labels["task"])
+            elif labels.get("pool") == PodPoolState.IDLE.value and pod.status.phase == "Running":
+                self.idle_pod_counts[module] = self.idle_pod_counts.get(module, 0) + 1
+        for module, task_uuids in tasks.items():
+            self.task_counts[module] = len(task_uuids)
+
+        app.logger.info(
+            "Loaded detector capacity successfully: cpu={}/{}, memory={}/{}".format(
+                self.used["cpu"], self.budget["cpu"], self.used["memory"], self.budget["memory"]
+            )
+        )
+
+    def admit(self, detector, pod_count):
+        module = detector.MODULE
+        max_tasks = detector.MAX_CONCURRENT_TASKS
+        if max_tasks is None:
+            max_tasks = app.config["DETECTOR_MAX_CONCURRENT_TASKS"]
+        if max_tasks > 0 and self.task_counts.get(module, 0) >= max_tasks:
+            return None
+
+        # Idle pods in the warm pool are leased instead of creating new pods, so they need no more capacity
+        idle_pod_count = 0
+        if app.config["DETECTOR_EXECUTION_MODE"] == ExecutionMode.EXEC.value:
+            idle_pod_count = min(pod_count, self.idle_pod_counts.get(module, 0))
+
+        requests = self.get_empty_resources()
+        for _ in range(pod_count - idle_pod_count):
+            self.add_resources(requests, detector.POD_RESOURCE_REQUEST)
+            if app.config["DETECTOR_EXECUTION_MODE"] == ExecutionMode.ENTRYPOINT.value:
+                self.add_resources(requests, detector.REPORT_SERVER_RESOURCE)
+        for resource in RESOURCES:
+            if self.used[resource] + requests[resource] > self.budget[resource]:
+                return None
+
+        # Reserve capacity for the admitted scan, so that following scans in the same poll see it
+        self.add_resources(self.used, requests)
+        self.task_counts[module] = self.task_counts.get(module, 0) + 1
+        self.idle_pod_counts[module] = self.idle_pod_counts.get(module, 0) - idle_pod_count
+        return {"module": module, "requests": requests, "idle_pod_count": idle_pod_count}
+
+    def release(self, reservation):
+        # Capacity reserved for a scan whose detector could not be created is given back to following scans
+        module = reservation["module"]
+        self.add_resources(self.used, reservation["requests"], -1)
+        self.task_counts[module] = self.task_counts.get(module, 0) - 1
+        self.idle_pod_counts[module] = self.idle_pod_counts.get(module, 0) + reservation["idle_pod_count"]
+
+    def get_budget(self):
+        budget = {"cpu": app.config["DETECTOR_CPU_BUDGET"], "memory": app.config["DETECTOR_MEMORY_BUDGET"]}
+        if all([budget[resource] != "" for resource in RESOURCES]):
+            return dict([(resource, parse_quantity(budget[resource])) for resource in RESOURCES])
+
+        # Discover the budget from allocatable resources of nodes minus requests of pods other than detectors
+        allocatable = self.get_empty_resources()
+        for node in self.core_api.list_node().items:
+            if not node.spec.unschedulable:
+                self.add_resources(allocatable, node.status.allocatable)
+        resp = self.core_api.list_pod_for_all_namespaces(
+            label_selector="app!={}".format(DETECTOR_POD_LABEL),
+            field_selector="status.phase!=Succeeded,status.phase!=Failed",
+        )
+        for pod in resp.items:
+            self.add_resources(allocatable, self.get_pod_requests(pod), -1)
+
+        for resource in RESOURCES:
+            if budget[resource] == "":
+                budget[resource] = allocatable[resource]
+            else:
+                budget[resource] = parse_quantity(budget[resource])
+        return budget
+
+    def get_detector_pods(self):
+        pods = []
+        for namespace in set([detector.POD_NAMESPACE for detector in dtm.detectors.values()]):
+            resp = self.core_api.list_namespaced_pod(
+                namespace=namespace, label_selector="app={}".format(DETECTOR_POD_LABEL)
+            )
+            pods.extend([pod for pod in resp.items if pod.status.phase not in ["Succeeded", "Failed"]])
+        return pods
+
+    def get_pod_requests(self, pod):
+        requests = self.get_empty_resources()
+        for container in pod.spec.containers:
+            if container.resources is not None and container.resources.requests is not None:
+                self.add_resources(requests, container.resources.requests)
+        return requests
+
+    def get_empty_resources(self):
+        return dict([(resource, Decimal(0)) for resource in RESOURCES])
+
+    def add_resources(self, resources, quantities, sign=1):
+        for resource in RESOURCES:
+            if resource in (quantities or {}):
+                resources[resource] += parse_quantity(quantities[resource]) * sign
@@ -0,0 +1,67 @@
+from datetime import timedelta
+
+import pytz
+from flask import current_app as app
+
+from models import DurationTable
+
+DURATION_SMOOTHING_FACTOR = 0.3
+CHECK_INTERVAL_RATIO = 0.5
+
+
+class DurationModel:
+    def __init__(self):
+        self.durations = {}
+
+    def learn(self, task, ended_at):
+        started_at = task["started_at"].replace(tzinfo=pytz.utc)
+        duration = (ended_at - started_at).total_seconds()
+        if duration <= 0:
+            return
+
+        # Exponential moving average follows recent changes of the target, e.g., more hosts and ports opened
+        alpha = DURATION_SMOOTHING_FACTOR
+        try:
+            DurationTable.insert(
+                detection_module=task["detection_module"], target=task["target"], duration=duration, count=1
+            ).on_conflict(
+                update={
+                    DurationTable.duration: DurationTable.duration * (1 - alpha) + duration * alpha,
+                    DurationTable.count: DurationTable.count + 1,
+                }
+            ).execute()
+            app.logger.info(
+                "Learned scan duration successfully: task={}, duration={}".format(task["uuid"], duration)
+            )
+        except Exception as error:
+            # Failing to learn must not fail the finished scan
+            app.logger.warn("ERROR: task={}, error={}".format(task["uuid"], error))
+
+    def estimate(self, module, target):
+        if module not in self.durations:
+            duration_query = DurationTable.select().where(DurationTable.detection_module == module)
+            self.durations[module] = dict([(d["target"], d) for d in duration_query.dicts()])
+
+        durations = self.durations[module]
+        if target in durations:
+            return durations[target]["duration"]
+
+        # Targets never scanned are expected to take as long as other targets of the same module on average
+        count = sum([d["count"] for d in durations.values()])
+        if count == 0:
+            return None
+        return sum([d["duration"] * d["count"] for d in durations.values()]) / count
+
+    def get_next_check_at(self, task, now):
+        min_interval = app.config["TASK_CHECK_MIN_INTERVAL_IN_SECOND"]
+        max_interval = app.config["TASK_CHECK_MAX_INTERVAL_IN_SECOND"]
+        expected = self.estimate(task["detection_module"], task["target"])
+        if expected is None:
+            return None
+
+        # Back off while the scan is far from the expected finish, and tighten the interval as it approaches.
+        # Once the scan overruns the expectation, back off again in proportion to the overrun.
+        elapsed = (now - task["started_at"].replace(tzinfo=pytz.utc)).total_seconds()
+        interval = abs(expected - elapsed) * CHECK_INTERVAL_RATIO
+        interval = min(max(interval, min_interval), max_interval)
+        return now + timedelta(seconds=interval)
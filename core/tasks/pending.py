@@ -1,3 +1,4 @@
+import uuid
 from datetime import timedelta
 
 import pytz
@@ -9,7 +10,10 @@ from models import TaskTable
 from tasks import TaskHandlerBase
 from tasks import TaskProgress
 from tasks.running import RunningTaskHandler
+from utils import serializer
 from utils.scan import get_safe_url
+from utils.scan import get_target_networks
+from utils.scan import is_overlapping_target
 from utils.scan import validate_host
 
 
@@ -17,18 +21,17 @@ class PendingTaskHandler(TaskHandlerBase):
     def __init__(self):
         super().__init__(TaskProgress.PENDING.name)
 
-    def add(self, scan):
+    def add(self, scan, admission=None):
         app.logger.info("Try to enqueue into {}: scan={}".format(self.progress, scan))
         detector = dtm.load_detector(scan["detection_module"], None)
 
         if detector.TARGET_TYPE == DetectionTarget.HOST.value:
-            validate_host(scan["target"])
+            validate_host(scan["target"], detector.SHARDABLE)
         elif detector.TARGET_TYPE == DetectionTarget.URL.value:
             scan["target"] = get_safe_url(scan["target"])
 
         # Avoid concurrent scanning for the same target
-        task_query = TaskTable.select().where(TaskTable.target == scan["target"])
-        if task_query.count() > 0:
+        if self.is_target_busy(scan["target"]):
             app.logger.info(
                 "Abandoned to enqueue scan={} because another scan for '{}' is still running".format(
                     scan["id"], scan["target"]
@@ -36,8 +39,23 @@ class PendingTaskHandler(TaskHandlerBase):
             )
             return None
 
-        session = detector.create()
+        # Hold the scan until detector pods fit into the cluster capacity, otherwise they would stay pending
+        reservation = None
+        if admission is not None:
+            reservation = admission.admit(detector, len(detector.get_shards(scan["target"])))
+            if reservation is None:
+                app.logger.info("Held scan={} because detector capacity is exhausted".format(scan["id"]))
+                return None
+
+        task_uuid = uuid.uuid4()
+        try:
+            session = detector.create(task_uuid.hex, scan["target"], scan["detection_mode"])
+        except Exception:
+            if reservation is not None:
+                admission.release(reservation)
+            raise
         task = {
+            "uuid": task_uuid,
             "audit_id": scan["audit_id"],
             "scan_id": scan["id"],
             "scan_uuid": scan["uuid"],
@@ -46,7 +64,7 @@ class PendingTaskHandler(TaskHandlerBase):
             "max_duration": scan["max_duration"],
             "detection_module": scan["detection_module"],
             "detection_mode": scan["detection_mode"],
-            "session": session,
+            "session": serializer.dumps(session),
             "progress": TaskProgress.PENDING.name,
         }
         task = TaskTable(**task)
@@ -54,6 +72,22 @@ class PendingTaskHandler(TaskHandlerBase):
         app.logger.info("Enqueued into {} successfully: scan={}".format(self.progress, scan["id"]))
         return task
 
+    def get_target_task_query(self, target):
+        return TaskTable.select().where(TaskTable.target == target)
+
+    def is_target_busy(self, target):
+        if self.get_target_task_query(target).count() > 0:
+            return True
+        if get_target_networks(target) is None:
+            return False
+
+        # Networks and addresses overlapping each other are the same target for scanners
+        task_query = TaskTable.select(TaskTable.target)
+        return any([is_overlapping_target(target, task["target"]) for task in task_query.dicts()])
+
+    def prefetch(self, tasks):
+        self.pods = self.get_detector_pods(tasks)
+
     def process(self, task):
         # Cancel if detector stays pending for a long time
         created_at = task["created_at"].replace(tzinfo=pytz.utc)
@@ -62,6 +96,6 @@ class PendingTaskHandler(TaskHandlerBase):
 
         # Check if detector is ready to scan
         detector = dtm.load_detector(task["detection_module"], task["session"])
-        if detector.is_ready():
+        if detector.is_ready(self.pods.get(task["uuid"].hex)):
             # Enqueue the task to running queue
             RunningTaskHandler().add(task)
@@ -0,0 +1,20 @@
+from flask import current_app as app
+
+from detectors import ExecutionMode
+from detectors import dtm
+
+
+class DetectorPoolHandler:
+    def poll(self):
+        min_size = app.config["DETECTOR_POOL_MIN_SIZE"]
+        max_size = app.config["DETECTOR_POOL_MAX_SIZE"]
+        # Idle pods are useless when scanners run as the container entrypoint
+        if app.config["DETECTOR_EXECUTION_MODE"] == ExecutionMode.ENTRYPOINT.value:
+            min_size = max_size = 0
+
+        for info in dtm.get_info():
+            try:
+                detector = dtm.load_detector(info["module"], None)
+                detector.fill_pool(min_size, max_size, app.config["DETECTOR_IDLE_TIMEOUT_IN_SECOND"])
+            except Exception as error:
+                app.logger.warn("ERROR: module={}, error={}".format(info["module"], error))
@@ -0,0 +1,48 @@
+import heapq
+
+import pytz
+from flask import current_app as app
+from peewee import fn
+
+from models import TaskTable
+
+
+def get_task_count_query():
+    return TaskTable.select(TaskTable.audit_id, fn.COUNT(TaskTable.id).alias("count")).group_by(
+        TaskTable.audit_id
+    )
+
+
+class ScanQueue:
+    def __init__(self, now):
+        self.now = now
+        # Tasks which audits already have count against their share
+        task_query = get_task_count_query()
+        self.task_counts = dict([(task["audit_id"], task["count"]) for task in task_query.dicts()])
+
+    def sort(self, scans):
+        audits = {}
+        for scan in sorted(scans, key=self.get_score, reverse=True):
+            audits.setdefault(scan["audit_id"], []).append(scan)
+
+        # Take the best scan among the heads of all audits. Score of an audit decreases with every task it has,
+        # so that an audit with many due scans cannot starve the others.
+        heap = [(-self.get_fair_score(audit_id, scans[0]), audit_id) for audit_id, scans in audits.items()]
+        heapq.heapify(heap)
+        sorted_scans = []
+        while len(heap) > 0:
+            _, audit_id = heapq.heappop(heap)
+            sorted_scans.append(audits[audit_id].pop(0))
+            self.task_counts[audit_id] = self.task_counts.get(audit_id, 0) + 1
+            if len(audits[audit_id]) > 0:
+                heapq.heappush(heap, (-self.get_fair_score(audit_id, audits[audit_id][0]), audit_id))
+        return sorted_scans
+
+    def get_score(self, scan):
+        # Priority grows while the scan is waiting, so that even a low priority scan eventually wins
+        waiting_hours = (self.now - scan["scheduled_at"].replace(tzinfo=pytz.utc)).total_seconds() / 3600
+        return scan["priority"] + max(0, waiting_hours) * app.config["SCAN_PRIORITY_AGING_PER_HOUR"]
+
+    def get_fair_score(self, audit_id, scan):
+        penalty = self.task_counts.get(audit_id, 0) * app.config["SCAN_FAIR_SHARE_PENALTY"]
+        return self.get_score(scan) - penalty
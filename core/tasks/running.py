@@ -11,21 +11,26 @@ from models import TaskTable
 from models import db
 from tasks import TaskHandlerBase
 from tasks import TaskProgress
+from tasks.duration import DurationModel
 from tasks.stopped import StoppedTaskHandler
+from utils import serializer
 
 
 class RunningTaskHandler(TaskHandlerBase):
     def __init__(self):
         super().__init__(TaskProgress.RUNNING.name)
+        self.duration_model = DurationModel()
 
     def add(self, task):
         app.logger.info("Try to enqueue into {}: task={}".format(self.progress, task))
         detector = dtm.load_detector(task["detection_module"], task["session"])
         session = detector.run(task["target"], task["detection_mode"])
 
-        task["session"] = session
+        self.observe_phase(task["progress"], task["created_at"])
+        task["session"] = serializer.dumps(session)
         task["progress"] = TaskProgress.RUNNING.name
         task["started_at"] = self.now
+        task["next_check_at"] = self.duration_model.get_next_check_at(task, self.now)
 
         with db.database.atomic():
             # Update task progress
@@ -37,6 +42,9 @@ class RunningTaskHandler(TaskHandlerBase):
         app.logger.info("Enqueued into {} successfully: task={}".format(self.progress, task["uuid"]))
         return
 
+    def prefetch(self, tasks):
+        self.pods = self.get_detector_pods(tasks)
+
     def process(self, task):
         # Cancel if detector stays running for a long time
         started_at = task["started_at"].replace(tzinfo=pytz.utc)
@@ -45,6 +53,11 @@ class RunningTaskHandler(TaskHandlerBase):
 
         # Check if detector is still running
         detector = dtm.load_detector(task["detection_module"], task["session"])
-        if not detector.is_running():
+        if not detector.is_running(self.pods.get(task["uuid"].hex)):
             # Enqueue the task to stopped queue
+            self.duration_model.learn(task, self.now)
             StoppedTaskHandler().add(task)
+        else:
+            # Next check is scheduled by the expected duration, instead of checking on every poll
+            next_check_at = self.duration_model.get_next_check_at(task, self.now)
+            TaskTable.update({"next_check_at": next_check_at}).where(TaskTable.uuid == task["uuid"]).execute()
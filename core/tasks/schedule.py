@@ -2,37 +2,57 @@ from datetime import datetime
 from datetime import timedelta
 
 import pytz
-from dateutil.rrule import rrulestr
 from flask import current_app as app
 from peewee import fn
 
 from models import ScanTable
 from models import db
+from tasks.admission import AdmissionController
 from tasks.pending import PendingTaskHandler
+from tasks.queue import ScanQueue
+from utils.schedule import get_next_run_at
 
 
 class TaskScheduler:
     def __init__(self):
         self.now = datetime.now(tz=pytz.utc)
 
+    def get_periodic_scan_query(self):
+        # Periodic scans which have finished the last run are waiting for the next run persisted in advance
+        return (
+            ScanTable()
+            .select()
+            .where(ScanTable.next_run_at.is_null(False) & ScanTable.scheduled_at.is_null())
+            .order_by(ScanTable.next_run_at.asc())
+        )
+
+    def get_due_scan_query(self):
+        # Get scan entries that scheduled time has elapsed but still not be in any tasks
+        return (
+            ScanTable().select().where((ScanTable.scheduled_at < fn.now()) & (ScanTable.task_uuid.is_null()))
+        )
+
     def set_next_periodic_scan_schedule(self):
-        scan_query = ScanTable().select().where((ScanTable.scheduled_at.is_null() & (ScanTable.rrule != "")))
-        for scan in scan_query.dicts():
+        for scan in self.get_periodic_scan_query().dicts():
             app.logger.info("Try to schedule next: scan={}".format(scan))
             try:
-                next_schedule = rrulestr(scan["rrule"])[0].replace(tzinfo=pytz.utc)
-                ScanTable.update({"scheduled_at": next_schedule}).where(ScanTable.id == scan["id"]).execute()
+                next_schedule = scan["next_run_at"].replace(tzinfo=pytz.utc)
+                # Skip occurrences missed while the scheduler was stopped
+                if next_schedule < self.now:
+                    next_schedule = get_next_run_at(scan["rrule"], self.now, inc=True)
+                next_run_at = get_next_run_at(scan["rrule"], next_schedule)
+                ScanTable.update({"scheduled_at": next_schedule, "next_run_at": next_run_at}).where(
+                    ScanTable.id == scan["id"]
+                ).execute()
                 app.logger.info("Scheduled next successfully: scan={}".format(scan["id"]))
             except Exception as error:
                 app.logger.error("ERROR: scan={}, error={}".format(scan["id"], error))
 
     def set_next_scan(self):
-        # Get scan entries that scheduled time has elapsed but still not be in any tasks
-        scan_query = (
-            ScanTable().select().where((ScanTable.scheduled_at < fn.now()) & (ScanTable.task_uuid.is_null()))
-        )
-
-        for scan in scan_query.dicts():
+        # Enqueue scans in order of priority while sharing capacity fairly among audits
+        scans = ScanQueue(self.now).sort(list(self.get_due_scan_query().dicts()))
+        admission = self.get_admission_controller()
+        for scan in scans:
             try:
                 app.logger.info("Try to set: scan={}".format(scan))
                 # Cancel scan if scan period has already elapsed
@@ -42,7 +62,7 @@ class TaskScheduler:
 
                 with db.database.atomic():
                     # Enqueue the task to pending queue
-                    task = PendingTaskHandler().add(scan)
+                    task = PendingTaskHandler().add(scan, admission)
                     if task:
                         # ToDo: Consider race condition between scan reschedule API and this thread context
                         ScanTable.update({"task_uuid": task.uuid}).where(ScanTable.id == scan["id"]).execute()
@@ -53,6 +73,16 @@ class TaskScheduler:
                 app.logger.warn("ERROR: scan={}, error={}".format(scan["id"], error))
                 self.reset_scan_schedule(scan, error)
 
+    def get_admission_controller(self):
+        if not app.config["DETECTOR_ADMISSION_CONTROL"]:
+            return None
+        try:
+            return AdmissionController()
+        except Exception as error:
+            # Scans are still scheduled without admission control rather than being blocked
+            app.logger.warn("ERROR: failed to load detector capacity, error={}".format(error))
+            return None
+
     def poll(self):
         self.set_next_periodic_scan_schedule()
         self.set_next_scan()
@@ -1,3 +1,5 @@
+from datetime import timedelta
+
 from flask import current_app as app
 
 from detectors import dtm
@@ -8,19 +10,43 @@ from models import ScanTable
 from models import TaskTable
 from models import db
 from storages import Storage
+from storages import uploader
 from tasks import TaskHandlerBase
 from tasks import TaskProgress
+from utils import metrics
 
 
 class StoppedTaskHandler(TaskHandlerBase):
     def __init__(self):
         super().__init__(TaskProgress.STOPPED.name)
+        self.uploads = []
+
+    def poll(self, task_uuid=None):
+        self.uploads = []
+        super().poll(task_uuid)
+
+        # Tasks are finished only after their reports are uploaded, so that a failed upload loses no report.
+        # Tasks whose upload is not confirmed are checked again later.
+        futures = [future for future, _, _ in self.uploads]
+        pending = uploader.wait(futures, app.config["STORAGE_UPLOAD_TIMEOUT_IN_SECOND"])
+        if pending > 0:
+            app.logger.warn("ERROR: reports are still being uploaded: pending={}".format(pending))
+        for future, task, results in self.uploads:
+            if not future.done() or not future.result():
+                app.logger.warn("ERROR: task={}, error=Report has not been uploaded yet".format(task["uuid"]))
+                continue
+            try:
+                self.complete(task, results)
+            except Exception as error:
+                app.logger.warn("ERROR: task={}, error={}".format(task["uuid"], error))
 
     def add(self, task):
         app.logger.info("Try to enqueue into {}: task={}".format(self.progress, task))
 
+        self.observe_phase(task["progress"], task["started_at"])
         task["progress"] = TaskProgress.STOPPED.name
         task["ended_at"] = self.now
+        task["next_check_at"] = None
 
         # Update task progress
         TaskTable.update(task).where(TaskTable.uuid == task["uuid"]).execute()
@@ -29,12 +55,31 @@ class StoppedTaskHandler(TaskHandlerBase):
         return
 
     def process(self, task):
+        if uploader.is_pending(task["uuid"]):
+            app.logger.info("Skipped: report of task={} is being uploaded".format(task["uuid"]))
+            return
         detector = dtm.load_detector(task["detection_module"], task["session"])
         results, report = detector.get_results()
 
-        # Store raw report to storage
-        Storage().store(task["scan_uuid"].hex, report)
+        # Report already stored by a former attempt is not uploaded again
+        if Storage().exists(task["uuid"]):
+            report.close()
+        elif app.config["STORAGE_UPLOAD_ASYNC"]:
+            # Task stays stopped and is not retried by other polls while its report is being uploaded
+            next_check_at = self.now + timedelta(seconds=app.config["TASK_LEASE_IN_SECOND"])
+            TaskTable.update({"next_check_at": next_check_at}).where(TaskTable.uuid == task["uuid"]).execute()
+            future = uploader.submit(task["scan_uuid"].hex, report, task["uuid"])
+            self.uploads.append((future, task, results))
+            return
+        else:
+            try:
+                Storage().store(task["scan_uuid"].hex, report, task["uuid"])
+            finally:
+                report.close()
+
+        self.complete(task, results)
 
+    def complete(self, task, results):
         # Change keys for conforming to result table schema
         for result in results:
             result["scan_id"] = task["scan_id"]
@@ -47,6 +92,8 @@ class StoppedTaskHandler(TaskHandlerBase):
 
         task["results"] = results
         im.send(NotificationType.RESULT, task)
+        metrics.detector_results.observe(len(results), module=task["detection_module"])
+        self.observe_phase(self.progress, task["ended_at"])
 
         # Destroy the task without error
         self.finish(task)
@@ -0,0 +1,33 @@
+import pytest
+from flask import Flask
+from peewee import SQL
+
+from models import CursorTable
+from models import DurationTable
+from models import TaskTable
+from models import db
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config["DATABASE"] = "sqlite:///:memory:"
+    app.config["STORAGE_BACKEND"] = "local"
+    app.config["STORAGE_LOCAL_ROOT"] = str(tmp_path)
+    app.config["STORAGE_COMPRESSION"] = "gzip"
+    app.config["STORAGE_REPORT_HISTORY_SIZE"] = 0
+    db.init_app(app)
+    with app.app_context():
+        yield app
+
+
+@pytest.fixture
+def tables(app, monkeypatch):
+    # SQLite has no ON UPDATE clause, so timestamps of rows are only set on insert in tests
+    models = [CursorTable, DurationTable, TaskTable]
+    for model in models:
+        for field in model._meta.sorted_fields:
+            if any(["ON UPDATE" in getattr(constraint, "sql", "") for constraint in field.constraints or []]):
+                monkeypatch.setattr(field, "constraints", [SQL("DEFAULT CURRENT_TIMESTAMP")])
+    db.database.create_tables(models)
+    return models
@@ -0,0 +1,34 @@
+from decimal import Decimal
+
+import pytest
+
+from tasks.admission import parse_quantity
+
+
+@pytest.mark.parametrize(
+    "quantity, value",
+    [
+        ("1", Decimal(1)),
+        (2, Decimal(2)),
+        ("0.5", Decimal("0.5")),
+        (".5", Decimal("0.5")),
+        ("500m", Decimal("0.5")),
+        ("100k", Decimal(100000)),
+        ("128Mi", Decimal(128 * 2 ** 20)),
+        ("1.5Gi", Decimal(3 * 2 ** 29)),
+        ("1Ei", Decimal(2 ** 60)),
+        ("1E", Decimal(10 ** 18)),
+        ("1e3", Decimal(1000)),
+        ("2E3", Decimal(2000)),
+        ("12e-3", Decimal("0.012")),
+        ("-1Ki", Decimal(-1024)),
+    ],
+)
+def test_parse_quantity(quantity, value):
+    assert parse_quantity(quantity) == value
+
+
+@pytest.mark.parametrize("quantity", ["", "Mi", "1x", "1 Gi", "1MiB"])
+def test_parse_invalid_quantity(quantity):
+    with pytest.raises(ValueError):
+        parse_quantity(quantity)
@@ -0,0 +1,38 @@
+import pytest
+from kubernetes.client import ApiClient
+from kubernetes.client import Configuration
+from kubernetes.client.rest import ApiException
+
+from detectors import TimeoutApiClient
+
+
+def test_request_retries_with_refreshed_token(monkeypatch):
+    configuration = Configuration()
+    configuration.api_key["authorization"] = "Bearer expired"
+    sent = []
+
+    def request(self, method, url, headers=None, _request_timeout=None):
+        sent.append(headers["authorization"])
+        if headers["authorization"] == "Bearer expired":
+            raise ApiException(status=401)
+        return "ok"
+
+    def refresh_token():
+        configuration.api_key["authorization"] = "Bearer refreshed"
+
+    monkeypatch.setattr(ApiClient, "request", request)
+    api_client = TimeoutApiClient(configuration, refresh_token)
+    assert api_client.request("GET", "/api", headers={"authorization": "Bearer expired"}) == "ok"
+    assert sent == ["Bearer expired", "Bearer refreshed"]
+
+
+def test_request_does_not_retry_other_errors(monkeypatch):
+    def request(self, method, url, headers=None, _request_timeout=None):
+        raise ApiException(status=403)
+
+    refreshed = []
+    monkeypatch.setattr(ApiClient, "request", request)
+    api_client = TimeoutApiClient(Configuration(), lambda: refreshed.append(True))
+    with pytest.raises(ApiException):
+        api_client.request("GET", "/api", headers={"authorization": "Bearer token"})
+    assert refreshed == []
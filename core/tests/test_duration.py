@@ -0,0 +1,61 @@
+import uuid
+from datetime import datetime
+from datetime import timedelta
+
+import pytest
+import pytz
+
+from models import DurationTable
+from tasks.duration import DurationModel
+
+NOW = datetime(2026, 10, 19, 9, 0, tzinfo=pytz.utc)
+
+
+@pytest.fixture
+def model(app, tables):
+    app.config["TASK_CHECK_MIN_INTERVAL_IN_SECOND"] = 10
+    app.config["TASK_CHECK_MAX_INTERVAL_IN_SECOND"] = 600
+    DurationTable.create(detection_module="nmap_7_80", target="203.0.113.1", duration=1000, count=1)
+    DurationTable.create(detection_module="nmap_7_80", target="203.0.113.2", duration=400, count=3)
+    return DurationModel()
+
+
+def get_task(target, elapsed):
+    started_at = (NOW - timedelta(seconds=elapsed)).replace(tzinfo=None)
+    return {"uuid": uuid.uuid4(), "detection_module": "nmap_7_80", "target": target, "started_at": started_at}
+
+
+def test_estimate(model):
+    assert model.estimate("nmap_7_80", "203.0.113.1") == 1000
+    # Targets never scanned are expected to take the average weighted by scan counts
+    assert model.estimate("nmap_7_80", "203.0.113.3") == 550
+    assert model.estimate("wpscan_latest", "https://example.com/") is None
+
+
+@pytest.mark.parametrize(
+    "elapsed, interval",
+    [
+        # Far from the expected finish, back off in proportion to the distance
+        (0, 500),
+        (800, 100),
+        # Near the expected finish, check as often as allowed
+        (995, 10),
+        # Overrun of the expectation backs off again up to the maximum interval
+        (1100, 50),
+        (5000, 600),
+    ],
+)
+def test_get_next_check_at(model, elapsed, interval):
+    task = get_task("203.0.113.1", elapsed)
+    assert model.get_next_check_at(task, NOW) == NOW + timedelta(seconds=interval)
+
+
+def test_get_next_check_at_without_history(model):
+    task = get_task("https://example.com/", 0)
+    task["detection_module"] = "wpscan_latest"
+    assert model.get_next_check_at(task, NOW) is None
+
+
+def test_learn_ignores_invalid_duration(model):
+    model.learn(get_task("203.0.113.1", -10), NOW)
+    assert DurationTable.get(DurationTable.target == "203.0.113.1").count == 1
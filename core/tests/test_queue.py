@@ -0,0 +1,52 @@
+from datetime import datetime
+from datetime import timedelta
+
+import pytest
+import pytz
+
+from models import TaskTable
+from tasks.queue import ScanQueue
+
+NOW = datetime(2026, 10, 19, 9, 0, tzinfo=pytz.utc)
+
+
+@pytest.fixture
+def queue(app, tables):
+    app.config["SCAN_PRIORITY_AGING_PER_HOUR"] = 1
+    app.config["SCAN_FAIR_SHARE_PENALTY"] = 1
+    return ScanQueue
+
+
+def get_scan(scan_id, audit_id, priority=0, waiting_hours=0):
+    scheduled_at = (NOW - timedelta(hours=waiting_hours)).replace(tzinfo=None)
+    return {"id": scan_id, "audit_id": audit_id, "priority": priority, "scheduled_at": scheduled_at}
+
+
+def test_get_score_ages_waiting_scans(queue):
+    scan_queue = queue(NOW)
+    assert scan_queue.get_score(get_scan(1, 1, priority=2)) == 2
+    assert scan_queue.get_score(get_scan(2, 1, priority=2, waiting_hours=3)) == 5
+    # Scans scheduled in the future are not penalized
+    assert scan_queue.get_score(get_scan(3, 1, priority=2, waiting_hours=-3)) == 2
+
+
+def test_sort_by_priority_and_aging(queue):
+    scans = [
+        get_scan(1, 1, priority=1),
+        get_scan(2, 2, priority=3),
+        get_scan(3, 3, priority=0, waiting_hours=5),
+    ]
+    assert [scan["id"] for scan in queue(NOW).sort(scans)] == [3, 2, 1]
+
+
+def test_sort_shares_fairly_among_audits(queue):
+    # An audit with many due scans takes turns with the others instead of going first with all of them
+    scans = [get_scan(i, 1) for i in range(1, 5)] + [get_scan(5, 2), get_scan(6, 3)]
+    assert [scan["id"] for scan in queue(NOW).sort(scans)] == [1, 5, 6, 2, 3, 4]
+
+
+def test_sort_counts_existing_tasks_of_audits(queue):
+    for _ in range(3):
+        TaskTable.create(audit_id=1, scheduled_at=NOW, started_at=NOW, ended_at=NOW)
+    scans = [get_scan(1, 1, priority=1), get_scan(2, 2)]
+    assert [scan["id"] for scan in queue(NOW).sort(scans)] == [2, 1]
@@ -0,0 +1,66 @@
+import ipaddress
+
+import pytest
+
+from utils.scan import get_network_range
+from utils.scan import get_network_shards
+from utils.scan import get_target_networks
+from utils.scan import is_network
+from utils.scan import is_overlapping_target
+
+
+def test_is_network():
+    assert is_network("203.0.113.0/24")
+    assert is_network("203.0.113.10-203.0.113.50")
+    assert is_network("203.0.113.10-50")
+    assert not is_network("203.0.113.10")
+    assert not is_network("example.com")
+
+
+def test_get_network_range():
+    first, last = get_network_range("203.0.113.5/24")
+    assert (str(first), str(last)) == ("203.0.113.0", "203.0.113.255")
+    first, last = get_network_range("203.0.113.10-50")
+    assert (str(first), str(last)) == ("203.0.113.10", "203.0.113.50")
+    with pytest.raises(Exception):
+        get_network_range("203.0.113.50-10")
+
+
+@pytest.mark.parametrize(
+    "target, max_shard_count, shard_count",
+    [("203.0.113.0/24", 4, 4), ("203.0.113.0/28", 4, 1), ("203.0.113.10-50", 4, 2), ("203.0.113.0/22", 3, 3)],
+)
+def test_get_network_shards(target, max_shard_count, shard_count):
+    shards = get_network_shards(target, max_shard_count)
+    assert len(shards) == shard_count
+
+    # Shards are contiguous and cover the whole range without any overlap
+    addresses = []
+    for shard in shards:
+        for network in shard.split(" "):
+            addresses.extend([int(address) for address in ipaddress.IPv4Network(network)])
+    first, last = get_network_range(target)
+    assert addresses == list(range(int(first), int(last) + 1))
+
+
+def test_get_target_networks():
+    assert get_target_networks("203.0.113.1") == [ipaddress.IPv4Network("203.0.113.1/32")]
+    assert get_target_networks("203.0.113.0-3") == [ipaddress.IPv4Network("203.0.113.0/30")]
+    assert get_target_networks("example.com") is None
+
+
+@pytest.mark.parametrize(
+    "target, other_target, overlapping",
+    [
+        ("203.0.113.0/24", "203.0.113.5", True),
+        ("203.0.113.0/24", "203.0.113.128/25", True),
+        ("203.0.113.10-20", "203.0.113.16/28", True),
+        ("203.0.113.10-15", "203.0.113.16/28", False),
+        ("203.0.113.0/24", "198.51.100.0/24", False),
+        ("example.com", "example.com", True),
+        ("example.com", "203.0.113.1", False),
+    ],
+)
+def test_is_overlapping_target(target, other_target, overlapping):
+    assert is_overlapping_target(target, other_target) == overlapping
+    assert is_overlapping_target(other_target, target) == overlapping
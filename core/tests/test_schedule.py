@@ -0,0 +1,55 @@
+import uuid
+from datetime import datetime
+
+import pytz
+
+from utils import schedule
+from utils.schedule import get_next_run_at
+from utils.schedule import get_slot_minute
+from utils.schedule import get_smoothed_minute
+from utils.schedule import get_weekly_rrule
+
+MONDAY_RRULE = "RRULE:FREQ=WEEKLY;BYDAY=MO;BYHOUR=9;BYMINUTE=5;BYSECOND=0"
+
+
+def test_get_weekly_rrule():
+    assert get_weekly_rrule(0, 9, 5) == MONDAY_RRULE
+    assert get_weekly_rrule(6, 23, 55) == "RRULE:FREQ=WEEKLY;BYDAY=SU;BYHOUR=23;BYMINUTE=55;BYSECOND=0"
+
+
+def test_get_next_run_at():
+    # 2026-10-19 is a Monday
+    after = datetime(2026, 10, 19, 9, 5, tzinfo=pytz.utc)
+    assert get_next_run_at(MONDAY_RRULE, after, inc=True) == after
+    assert get_next_run_at(MONDAY_RRULE, after) == datetime(2026, 10, 26, 9, 5, tzinfo=pytz.utc)
+
+    # Occurrences are found from any time, not only from the first one
+    after = datetime(2026, 10, 21, 0, 0, 30, 500, tzinfo=pytz.utc)
+    assert get_next_run_at(MONDAY_RRULE, after) == datetime(2026, 10, 26, 9, 5, tzinfo=pytz.utc)
+
+
+def test_get_next_run_at_with_timezone():
+    after = datetime(2026, 10, 19, 18, 0, tzinfo=pytz.utc).astimezone(pytz.timezone("Asia/Tokyo"))
+    assert get_next_run_at(MONDAY_RRULE, after) == datetime(2026, 10, 26, 9, 5, tzinfo=pytz.utc)
+
+
+def test_get_slot_minute():
+    assert [get_slot_minute(minute) for minute in [0, 4, 5, 59, "12"]] == [0, 0, 5, 55, 10]
+
+
+def test_get_smoothed_minute(monkeypatch):
+    scan_uuid = uuid.UUID(int=7)
+
+    # Scan starts at its own offset while the hour is empty
+    monkeypatch.setattr(schedule, "get_schedule_load", lambda exclude_scan_uuid=None: {})
+    assert get_smoothed_minute(scan_uuid, 0, 9) == 7
+
+    # Scan moves forward to the next slot less loaded than the slot of its offset
+    load = {(0, 9, 5): 2, (0, 9, 10): 1, (0, 9, 15): 0}
+    for minute in range(0, 60, 5):
+        load.setdefault((0, 9, minute), 3)
+    monkeypatch.setattr(schedule, "get_schedule_load", lambda exclude_scan_uuid=None: load)
+    assert get_smoothed_minute(scan_uuid, 0, 9) == 15
+
+    # Load of other weekdays and hours does not matter
+    assert get_smoothed_minute(scan_uuid, 1, 9) == 7
@@ -0,0 +1,121 @@
+import contextlib
+import gzip
+import io
+import os
+
+import pytest
+
+import storages
+from storages import AbstractReport
+from storages import Codec
+from storages import GzipCodec
+from storages import Storage
+from storages import ZstdCodec
+from storages import get_codec
+from storages import local
+
+DATA = b"".join([b"line %d of the scan report\n" % i for i in range(5000)])
+
+
+class MemoryReport(AbstractReport):
+    def __init__(self, data, encoding, uncompressed_size, chunk_size):
+        super().__init__(encoding, len(data), uncompressed_size)
+        self.data = data
+        self.chunk_size = chunk_size
+
+    def iter_raw(self, start=0, stop=None):
+        stop = self.size if stop is None else stop
+        for offset in range(start, stop, self.chunk_size):
+            yield self.data[offset : min(offset + self.chunk_size, stop)]
+
+
+def compress(codec, data):
+    compressed = io.BytesIO()
+    codec.compress(io.BytesIO(data), compressed)
+    return compressed.getvalue()
+
+
+def get_codecs():
+    codecs = [Codec(), GzipCodec()]
+    if storages.zstandard is not None:
+        codecs.append(ZstdCodec())
+    return codecs
+
+
+@pytest.mark.parametrize("codec", get_codecs(), ids=lambda codec: codec.ENCODING)
+def test_codec_round_trip(codec):
+    report = MemoryReport(compress(codec, DATA), codec.ENCODING, len(DATA), 1000)
+    assert b"".join(report.iter_decoded()) == DATA
+
+
+def test_get_codec():
+    assert isinstance(get_codec("gzip"), GzipCodec)
+    assert isinstance(get_codec("identity"), Codec)
+    assert isinstance(get_codec("unknown"), Codec)
+
+
+@pytest.mark.parametrize("codec", get_codecs(), ids=lambda codec: codec.ENCODING)
+@pytest.mark.parametrize(
+    "start, stop", [(0, 1), (0, len(DATA)), (100, 200), (999, 1001), (len(DATA) - 10, len(DATA)), (50, 50)]
+)
+def test_iter_decoded_range(codec, start, stop):
+    # Small raw chunks make ranges start and end in the middle of decompressed chunks
+    report = MemoryReport(compress(codec, DATA), codec.ENCODING, len(DATA), 7)
+    assert b"".join(report.iter_decoded(start, stop)) == DATA[start:stop]
+
+
+def test_gzip_compatibility():
+    assert gzip.decompress(compress(GzipCodec(), DATA)) == DATA
+
+
+@pytest.fixture
+def storage(app, monkeypatch):
+    monkeypatch.setattr(storages, "backends", {})
+    # Locks and references live in MySQL, so only the content addressing is exercised here
+    monkeypatch.setattr(storages, "report_lock", lambda digest: contextlib.suppress())
+    references = []
+
+    def refer(self, uuid, task_uuid, digest, size):
+        references.append((uuid, digest, size))
+        return True
+
+    monkeypatch.setattr(Storage, "refer", refer)
+    storage = Storage()
+    storage.references = references
+    return storage
+
+
+def test_store_deduplicates_reports(storage, monkeypatch):
+    puts = []
+    put = storage.backend.put
+    monkeypatch.setattr(storage.backend, "put", lambda key, *args: puts.append(key) or put(key, *args))
+
+    digest = storage.store("a" * 32, DATA)
+    assert storage.store("b" * 32, io.BytesIO(DATA)) == digest
+    assert len(puts) == 1
+    assert storage.references == [("a" * 32, digest, len(DATA)), ("b" * 32, digest, len(DATA))]
+
+    # Stored report is compressed and decoded back to the original content
+    report = storage.backend.get(storage._get_key_from_digest(digest))
+    assert report.encoding == "gzip"
+    assert report.size < len(DATA)
+    assert b"".join(report.iter_decoded()) == DATA
+
+    assert storage.store("a" * 32, DATA.decode("utf-8") + "\n") != digest
+    assert len(puts) == 2
+
+
+def test_local_backend_rejects_inconsistent_metadata(storage):
+    key = storage._get_key_from_digest("0" * 64)
+    storage.backend.put(key, io.BytesIO(compress(GzipCodec(), DATA)), "gzip", len(DATA))
+    assert b"".join(storage.backend.get(key).iter_decoded()) == DATA
+
+    # Report replaced after its metadata, e.g., by a concurrent upload in another encoding
+    with open(storage.backend._get_path(key), "wb") as f:
+        f.write(DATA)
+    with pytest.raises(Exception, match="does not match"):
+        storage.backend.get(key)
+
+    os.remove(storage.backend._get_path(key) + local.METADATA_SUFFIX)
+    with pytest.raises(Exception, match="no metadata"):
+        storage.backend.get(key)
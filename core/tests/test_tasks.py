@@ -0,0 +1,136 @@
+import threading
+import time
+from datetime import datetime
+from datetime import timedelta
+
+import pytz
+from flask import g
+
+import tasks
+from models import CursorTable
+from models import TaskTable
+from tasks import TaskHandlerBase
+
+
+class RecordingTaskHandler(TaskHandlerBase):
+    def __init__(self, delays=None):
+        super().__init__("RUNNING")
+        self.delays = delays or {}
+        self.handled = []
+        self.hosts = []
+        self.lock = threading.Lock()
+
+    def handle(self, task):
+        time.sleep(self.delays.get(task["uuid"], 0))
+        with self.lock:
+            self.handled.append(task["uuid"])
+            self.hosts.append(g.get("request_host"))
+
+
+def test_handle_concurrently_within_request(app):
+    app.config["TASK_POLL_CONCURRENCY"] = 4
+    app.config["TASK_PROCESS_TIMEOUT_IN_SECOND"] = 60
+    handler = RecordingTaskHandler()
+    with app.test_request_context("/task/running/", headers={"Host": "ntd.example.com"}):
+        remaining_tasks = handler.handle_concurrently([{"uuid": i} for i in range(8)], time.monotonic() + 60)
+
+    assert remaining_tasks == []
+    assert sorted(handler.handled) == list(range(8))
+    assert handler.hosts == ["ntd.example.com"] * 8
+
+
+def test_handle_concurrently_keeps_handling_after_timeout(app, monkeypatch):
+    monkeypatch.setattr(tasks, "TASK_JOIN_TIMEOUT_IN_SECOND", 0)
+    app.config["TASK_POLL_CONCURRENCY"] = 2
+    app.config["TASK_PROCESS_TIMEOUT_IN_SECOND"] = 0.5
+    handler = RecordingTaskHandler({0: 3})
+    started_at = time.monotonic()
+    remaining_tasks = handler.handle_concurrently([{"uuid": i} for i in range(5)], time.monotonic() + 60)
+
+    # Slow task neither cancels the others nor holds the poll until it ends
+    assert remaining_tasks == []
+    assert sorted(handler.handled) == [1, 2, 3, 4]
+    assert time.monotonic() - started_at < 3
+
+
+def test_handle_concurrently_leaves_tasks_over_budget(app):
+    app.config["TASK_POLL_CONCURRENCY"] = 2
+    app.config["TASK_PROCESS_TIMEOUT_IN_SECOND"] = 60
+    handler = RecordingTaskHandler(dict([(i, 0.5) for i in range(6)]))
+    remaining_tasks = handler.handle_concurrently([{"uuid": i} for i in range(6)], time.monotonic() + 0.1)
+
+    assert len(remaining_tasks) > 0
+    assert sorted(handler.handled + [task["uuid"] for task in remaining_tasks]) == list(range(6))
+
+
+def get_queued_tasks(count):
+    updated_at = datetime(2026, 10, 19, 9, 0)
+    # Tasks updated at the same time are ordered by their IDs
+    return [{"id": i, "uuid": i, "updated_at": updated_at + timedelta(seconds=i // 2)} for i in range(count)]
+
+
+def test_resume_without_cursor(app, tables):
+    queued_tasks = get_queued_tasks(4)
+    assert RecordingTaskHandler().resume(list(queued_tasks)) == queued_tasks
+
+
+def test_resume_from_cursor(app, tables):
+    queued_tasks = get_queued_tasks(6)
+    CursorTable.create(progress="RUNNING", task_updated_at=queued_tasks[3]["updated_at"], task_id=3)
+
+    # Tasks before the cursor are handled after the others, as they were handled in the last poll
+    resumed_tasks = RecordingTaskHandler().resume(list(queued_tasks))
+    assert [task["id"] for task in resumed_tasks] == [3, 4, 5, 0, 1, 2]
+
+    # Task at the cursor may have been updated and left the queue meanwhile
+    resumed_tasks = RecordingTaskHandler().resume(queued_tasks[0:3] + queued_tasks[4:])
+    assert [task["id"] for task in resumed_tasks] == [4, 5, 0, 1, 2]
+
+
+def test_save_cursor_clears_after_all_tasks(app, tables):
+    CursorTable.create(progress="RUNNING", task_updated_at=datetime(2026, 10, 19, 9, 0), task_id=3)
+    CursorTable.create(progress="PENDING", task_updated_at=datetime(2026, 10, 19, 9, 0), task_id=3)
+    RecordingTaskHandler().save_cursor(None)
+    assert [cursor.progress for cursor in CursorTable.select()] == ["PENDING"]
+
+
+def create_task(progress="RUNNING", **kwargs):
+    now = datetime.now(tz=pytz.utc)
+    task = TaskTable.create(progress=progress, scheduled_at=now, started_at=now, ended_at=now, **kwargs)
+    return {"uuid": task.uuid}
+
+
+def test_claim_leases_task_once(app, tables):
+    app.config["TASK_LEASE_IN_SECOND"] = 300
+    task = create_task()
+    claimed_task = RecordingTaskHandler().claim(task)
+    assert claimed_task["claimed_by"] != ""
+    assert claimed_task["lease_until"] is not None
+
+    # Other workers cannot claim the task while it is leased, nor tasks of another progress
+    assert RecordingTaskHandler().claim(task) is None
+    assert RecordingTaskHandler().claim(create_task(progress="PENDING")) is None
+
+
+def test_claim_task_of_expired_lease(app, tables):
+    app.config["TASK_LEASE_IN_SECOND"] = 300
+    lease_until = datetime.now(tz=pytz.utc) - timedelta(seconds=1)
+    task = create_task(claimed_by="dead-worker", lease_until=lease_until)
+    claimed_task = RecordingTaskHandler().claim(task)
+    assert claimed_task is not None
+    assert claimed_task["claimed_by"] != "dead-worker"
+
+
+def test_release_only_own_lease(app, tables):
+    app.config["TASK_LEASE_IN_SECOND"] = 300
+    task = create_task()
+    claimed_task = RecordingTaskHandler().claim(task)
+
+    # Lease taken over by another worker after expiry is kept
+    RecordingTaskHandler().release(dict(claimed_task, claimed_by="other-worker"))
+    assert TaskTable.get(TaskTable.uuid == task["uuid"]).claimed_by == claimed_task["claimed_by"]
+
+    RecordingTaskHandler().release(claimed_task)
+    released_task = TaskTable.get(TaskTable.uuid == task["uuid"])
+    assert released_task.claimed_by == ""
+    assert released_task.lease_until is None
@@ -0,0 +1,170 @@
+import functools
+import threading
+import time
+
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300]
+PHASE_BUCKETS = [10, 60, 300, 600, 1800, 3600, 7200, 14400, 28800, 86400]
+COUNT_BUCKETS = [0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000]
+
+
+class Metric:
+    TYPE = "untyped"
+
+    def __init__(self, name, description, label_names):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def expose(self):
+        lines = [
+            "# HELP {} {}".format(self.name, self.description),
+            "# TYPE {} {}".format(self.name, self.TYPE),
+        ]
+        with self.lock:
+            for label_values, value in sorted(self.values.items()):
+                lines.extend(self.expose_value(label_values, value))
+        return lines
+
+    def expose_value(self, label_values, value):
+        return [self.get_sample(self.name, label_values, value)]
+
+    def get_sample(self, name, label_values, value, extra_labels=()):
+        labels = list(zip(self.label_names, label_values)) + list(extra_labels)
+        if len(labels) == 0:
+            return "{} {}".format(name, value)
+        labels = ",".join(['{}="{}"'.format(k, self.escape(v)) for k, v in labels])
+        return "{}{{{}}} {}".format(name, labels, value)
+
+    def get_label_values(self, labels):
+        return tuple([str(labels[name]) for name in self.label_names])
+
+    def escape(self, value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Counter(Metric):
+    TYPE = "counter"
+
+    def inc(self, amount=1, **labels):
+        label_values = self.get_label_values(labels)
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+
+class Gauge(Metric):
+    TYPE = "gauge"
+
+    def __init__(self, name, description, label_names):
+        super().__init__(name, description, label_names)
+        self.updated_at = None
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self.get_label_values(labels)] = value
+            self.updated_at = time.monotonic()
+
+    def is_stale(self, max_age):
+        return self.updated_at is None or time.monotonic() - self.updated_at > max_age
+
+
+class Histogram(Metric):
+    TYPE = "histogram"
+
+    def __init__(self, name, description, label_names, buckets):
+        super().__init__(name, description, label_names)
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        label_values = self.get_label_values(labels)
+        with self.lock:
+            counts, total, count = self.values.get(label_values, ([0] * len(self.buckets), 0, 0))
+            # Buckets are cumulative, i.e., an observation is counted in every bucket not less than the value
+            counts = [c + 1 if value <= bucket else c for c, bucket in zip(counts, self.buckets)]
+            self.values[label_values] = (counts, total + value, count + 1)
+
+    def expose_value(self, label_values, value):
+        counts, total, count = value
+        lines = []
+        for bucket, bucket_count in zip(self.buckets, counts):
+            lines.append(self.get_sample(self.name + "_bucket", label_values, bucket_count, [("le", bucket)]))
+        return lines + [
+            self.get_sample(self.name + "_bucket", label_values, count, [("le", "+Inf")]),
+            self.get_sample(self.name + "_sum", label_values, total),
+            self.get_sample(self.name + "_count", label_values, count),
+        ]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, description, label_names=()):
+        return self.register(Counter(name, description, label_names))
+
+    def gauge(self, name, description, label_names=()):
+        return self.register(Gauge(name, description, label_names))
+
+    def histogram(self, name, description, label_names=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, description, label_names, buckets))
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def expose(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+
+def measure(histogram, errors=None, **labels):
+    def decorator(f):
+        @functools.wraps(f)
+        def decorate(*args, **kwargs):
+            started_at = time.perf_counter()
+            try:
+                return f(*args, **kwargs)
+            except Exception:
+                if errors is not None:
+                    errors.inc(**labels)
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - started_at, **labels)
+
+        return decorate
+
+    return decorator
+
+
+registry = Registry()
+
+task_queue_depth = registry.gauge("ntd_task_queue_depth", "Number of tasks in each progress", ["progress"])
+task_poll_seconds = registry.histogram(
+    "ntd_task_poll_seconds", "Time spent to poll a task queue", ["progress"]
+)
+task_process_seconds = registry.histogram(
+    "ntd_task_process_seconds", "Time spent to process a task", ["progress"]
+)
+task_errors = registry.counter("ntd_task_errors_total", "Number of tasks finished with errors", ["progress"])
+task_phase_seconds = registry.histogram(
+    "ntd_task_phase_seconds", "Time tasks spent in each progress", ["progress"], PHASE_BUCKETS
+)
+detector_operation_seconds = registry.histogram(
+    "ntd_detector_operation_seconds", "Time spent in detector operations", ["module", "operation"]
+)
+detector_operation_errors = registry.counter(
+    "ntd_detector_operation_errors_total", "Number of failed detector operations", ["module", "operation"]
+)
+detector_results = registry.histogram(
+    "ntd_detector_results", "Number of results of a scan", ["module"], COUNT_BUCKETS
+)
+storage_operation_seconds = registry.histogram(
+    "ntd_storage_operation_seconds", "Time spent in storage operations", ["operation"]
+)
+storage_pending_uploads = registry.gauge("ntd_storage_pending_uploads", "Number of reports being uploaded")
+storage_upload_errors = registry.counter(
+    "ntd_storage_upload_errors_total", "Number of reports failed to upload after retries"
+)
@@ -1,5 +1,6 @@
 import ipaddress
 import os
+import re
 import socket
 import urllib
 from datetime import datetime
@@ -8,9 +9,14 @@ import pytz
 import validators
 from flask import abort
 
+from models import ResultTable
 from models import ScanTable
 
 SCAN_SCHEDULABLE_DAYS_FROM_NOW = 7
+SCAN_MAX_NETWORK_SIZE = 1024
+SCAN_MIN_SHARD_SIZE = 16
+
+NETWORK_PATTERN = re.compile(r"^\d{1,3}(\.\d{1,3}){3}(/\d{1,2}|-(\d{1,3}\.){0,3}\d{1,3})$")
 
 
 def get_scan_by_uuid(scan_uuid):
@@ -21,6 +27,14 @@ def get_scan_by_uuid(scan_uuid):
         abort(404)
 
 
+def get_audit_scans_query(audit_id):
+    return ScanTable.select().where(ScanTable.audit_id == audit_id)
+
+
+def get_scan_results_query(scan_ids):
+    return ResultTable.select(ResultTable).where(ResultTable.scan_id << scan_ids)
+
+
 def validate_schedule(scheduled_at):
     scheduled_at = scheduled_at.replace(tzinfo=pytz.utc)
     now = datetime.now(tz=pytz.utc).astimezone(pytz.timezone("Asia/Tokyo"))
@@ -64,8 +78,10 @@ def get_safe_url(target):
     )
 
 
-def validate_host(target):
-    if validators.ip_address.ipv4(target):
+def validate_host(target, allow_network=False):
+    if allow_network and is_network(target):
+        validate_network(target)
+    elif validators.ip_address.ipv4(target):
         if not ipaddress.ip_address(target).is_global:
             raise Exception("Private IP address is not allowed")
     elif validators.domain(target):
@@ -84,3 +100,70 @@ def validate_host(target):
         raise Exception("Not a valid FQDN or IPv4 address")
 
     return True
+
+
+def is_network(target):
+    return NETWORK_PATTERN.match(target) is not None
+
+
+def get_network_range(target):
+    # Accept CIDR blocks, e.g., '203.0.113.0/24',
+    # and ranges, e.g., '203.0.113.10-203.0.113.50' or '203.0.113.10-50'.
+    if "/" in target:
+        network = ipaddress.IPv4Network(target, strict=False)
+        return network.network_address, network.broadcast_address
+
+    first, last = target.split("-", 1)
+    first = ipaddress.IPv4Address(first)
+    last_octets = last.split(".")
+    last = ipaddress.IPv4Address(".".join(str(first).split(".")[: 4 - len(last_octets)] + last_octets))
+    if last < first:
+        raise Exception("End of range is smaller than start")
+    return first, last
+
+
+def get_target_networks(target):
+    # Addresses and networks are compared as CIDR blocks, while the other targets, e.g., FQDN, have none
+    if is_network(target):
+        return list(ipaddress.summarize_address_range(*get_network_range(target)))
+    if validators.ip_address.ipv4(target):
+        return [ipaddress.IPv4Network(target)]
+    return None
+
+
+def is_overlapping_target(target, other_target):
+    networks = get_target_networks(target)
+    other_networks = get_target_networks(other_target)
+    if networks is None or other_networks is None:
+        return target == other_target
+    return any([network.overlaps(other_network) for network in networks for other_network in other_networks])
+
+
+def validate_network(target):
+    try:
+        first, last = get_network_range(target)
+    except Exception:
+        raise Exception("Not a valid IPv4 network or range")
+
+    if int(last) - int(first) + 1 > SCAN_MAX_NETWORK_SIZE:
+        raise Exception("Network must not be larger than {} addresses".format(SCAN_MAX_NETWORK_SIZE))
+
+    for addr in range(int(first), int(last) + 1):
+        if not ipaddress.ip_address(addr).is_global:
+            raise Exception("Private IP address is not allowed")
+
+    return True
+
+
+def get_network_shards(target, max_shard_count):
+    first, last = get_network_range(target)
+    size = int(last) - int(first) + 1
+    count = max(1, min(max_shard_count, size // SCAN_MIN_SHARD_SIZE))
+
+    # Split the range into contiguous shards of nearly equal size, each described as a list of CIDR blocks
+    shards = []
+    for i in range(count):
+        start = ipaddress.IPv4Address(int(first) + size * i // count)
+        end = ipaddress.IPv4Address(int(first) + size * (i + 1) // count - 1)
+        shards.append(" ".join([str(network) for network in ipaddress.summarize_address_range(start, end)]))
+    return shards
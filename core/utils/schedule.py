@@ -0,0 +1,69 @@
+import re
+from datetime import datetime
+
+import pytz
+from dateutil.rrule import rrulestr
+
+from models import ScanTable
+
+SCHEDULE_SLOT_IN_MINUTE = 5
+
+RRULE_WEEKDAY_LIST = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+RRULE_PATTERN = re.compile(r"BYDAY=(\w{2});BYHOUR=(\d{1,2});BYMINUTE=(\d{1,2})")
+
+
+def get_weekly_rrule(weekday, hour, minute):
+    return "RRULE:FREQ=WEEKLY;BYDAY={};BYHOUR={};BYMINUTE={};BYSECOND=0".format(
+        RRULE_WEEKDAY_LIST[weekday], hour, minute
+    )
+
+
+def get_schedule_load(exclude_scan_uuid=None):
+    # Count periodic scans starting in each slot of a week, i.e., (weekday, hour, minute of the slot)
+    scan_query = ScanTable.select(ScanTable.rrule).where(ScanTable.rrule != "")
+    if exclude_scan_uuid is not None:
+        scan_query = scan_query.where(ScanTable.uuid != exclude_scan_uuid)
+
+    load = {}
+    for scan in scan_query.dicts():
+        match = RRULE_PATTERN.search(scan["rrule"])
+        if match is None or match.group(1) not in RRULE_WEEKDAY_LIST:
+            continue
+        weekday = RRULE_WEEKDAY_LIST.index(match.group(1))
+        slot = (weekday, int(match.group(2)), get_slot_minute(match.group(3)))
+        load[slot] = load.get(slot, 0) + 1
+    return load
+
+
+def get_smoothed_minute(scan_uuid, weekday, hour):
+    # Each scan gets its own deterministic offset within the hour, then moves to the least loaded slot from
+    # there, so that periodic scans of the same hour do not start all at once
+    load = get_schedule_load(scan_uuid)
+    offset = scan_uuid.int % 60
+    minutes = [(offset + i) % 60 for i in range(60)]
+    return min(minutes, key=lambda minute: load.get((weekday, hour, get_slot_minute(minute)), 0))
+
+
+def get_slot_minute(minute):
+    return int(minute) // SCHEDULE_SLOT_IN_MINUTE * SCHEDULE_SLOT_IN_MINUTE
+
+
+def get_next_run_at(rrule, after, inc=False):
+    # Rules are evaluated in naive UTC as scheduled times are stored without timezone
+    after = after.astimezone(pytz.utc).replace(tzinfo=None, microsecond=0)
+    # Occurrences are generated from dtstart, so the lookup starts from `after` to keep it short
+    next_run_at = rrulestr(rrule, dtstart=after).after(after, inc=inc)
+    if next_run_at is None:
+        return None
+    return next_run_at.replace(tzinfo=pytz.utc)
+
+
+def backfill_next_run_at():
+    # Periodic scans created before `next_run_at` was introduced run next at their first occurrence from now
+    now = datetime.now(tz=pytz.utc)
+    scan_query = ScanTable.select(ScanTable.id, ScanTable.rrule).where(
+        (ScanTable.rrule != "") & ScanTable.next_run_at.is_null()
+    )
+    for scan in scan_query.dicts():
+        next_run_at = get_next_run_at(scan["rrule"], now, inc=True)
+        ScanTable.update({"next_run_at": next_run_at}).where(ScanTable.id == scan["id"]).execute()
@@ -0,0 +1,32 @@
+import json
+from ast import literal_eval
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def load(f):
+    # Neither decoder parses incrementally, so reading the file at once costs nothing extra
+    return loads(f.read())
+
+
+def dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj)
+
+
+def load_session(session):
+    try:
+        return loads(session)
+    except ValueError:
+        # Sessions stored before JSON serialization was introduced are Python literals
+        return literal_eval(session)
@@ -0,0 +1,142 @@
+import concurrent.futures
+import threading
+import time
+
+from kubernetes import watch
+
+from app import app
+from detectors import DETECTOR_POD_LABEL
+from detectors import dtm
+from detectors import kcm
+from models import db
+from tasks.pending import PendingTaskHandler
+from tasks.running import RunningTaskHandler
+from tasks.stopped import StoppedTaskHandler
+
+WATCH_TIMEOUT_IN_SECOND = 60
+RESYNC_INTERVAL_IN_SECOND = 300
+RETRY_INTERVAL_IN_SECOND = 10
+POLL_WORKER_COUNT = 4
+
+
+class DetectorWatcher:
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self.label_selector = "app={}".format(DETECTOR_POD_LABEL)
+        self.resource_version = None
+        self.resynced_at = 0
+        # Pods are cached from the list and watch events, so that handlers need no list call on every event
+        self.pods = {}
+        # Tasks are polled by workers, so that the watch loop only records events and never waits on handlers.
+        # Events of a task already queued only refresh its pods, so a burst of events results in one poll.
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=POLL_WORKER_COUNT)
+        self.queued = {}
+        self.lock = threading.Lock()
+
+    def run(self):
+        while True:
+            try:
+                # Resync periodically because watch events can be lost, e.g., while this process is down
+                resync_at = self.resynced_at + RESYNC_INTERVAL_IN_SECOND
+                if self.resource_version is None or time.time() > resync_at:
+                    self.resync()
+                self.watch()
+            except Exception as error:
+                app.logger.warn("ERROR: namespace={}, error={}".format(self.namespace, error))
+                self.resource_version = None
+                time.sleep(RETRY_INTERVAL_IN_SECOND)
+
+    def resync(self):
+        app.logger.info("Try to resync detector pods: namespace={}".format(self.namespace))
+        resp = kcm.get_core_api().list_namespaced_pod(
+            namespace=self.namespace, label_selector=self.label_selector
+        )
+        self.pods = dict([(pod.metadata.name, pod) for pod in resp.items])
+        for pod in resp.items:
+            self.dispatch(pod)
+
+        self.resource_version = resp.metadata.resource_version
+        self.resynced_at = time.time()
+        app.logger.info("Resynced detector pods successfully: namespace={}".format(self.namespace))
+
+    def watch(self):
+        stream = watch.Watch().stream(
+            kcm.get_core_api().list_namespaced_pod,
+            namespace=self.namespace,
+            label_selector=self.label_selector,
+            resource_version=self.resource_version,
+            timeout_seconds=WATCH_TIMEOUT_IN_SECOND,
+            # Watch stays silent while no pod changes, so it must not be cut by the default request timeout
+            _request_timeout=WATCH_TIMEOUT_IN_SECOND * 2,
+        )
+        for event in stream:
+            if event["type"] == "ERROR":
+                # Resource version has been compacted (410 Gone), so start over from a fresh list
+                app.logger.warn("ERROR: namespace={}, event={}".format(self.namespace, event["raw_object"]))
+                self.resource_version = None
+                return
+
+            pod = event["object"]
+            self.resource_version = pod.metadata.resource_version
+            if event["type"] == "DELETED":
+                self.pods.pop(pod.metadata.name, None)
+            else:
+                self.pods[pod.metadata.name] = pod
+                self.dispatch(pod)
+
+    def dispatch(self, pod):
+        labels = pod.metadata.labels or {}
+        # Idle pods in the warm pool are not bound to any task
+        if "task" not in labels:
+            return
+
+        # Pods become ready once their scan has finished, or their scanner exits in entrypoint mode
+        if pod.status.phase == "Running" and not (self.is_ready(pod) or self.is_terminated(pod)):
+            handlers = [PendingTaskHandler()]
+        elif pod.status.phase in ["Running", "Succeeded", "Failed"]:
+            handlers = [RunningTaskHandler(), StoppedTaskHandler()]
+        else:
+            return
+
+        # Hand off all pods of the task to handlers, so that they do not list pods again.
+        # Cron polls may handle the same task meanwhile, but only one of them can claim it.
+        pods = [p for p in self.pods.values() if (p.metadata.labels or {}).get("task") == labels["task"]]
+        with self.lock:
+            queued = labels["task"] in self.queued
+            self.queued[labels["task"]] = (handlers, pods)
+        if not queued:
+            self.executor.submit(self.poll, labels["task"])
+
+    def poll(self, task_uuid):
+        with self.lock:
+            handlers, pods = self.queued.pop(task_uuid)
+        with app.app_context(), db.database.connection_context():
+            for handler in handlers:
+                handler.pods[task_uuid] = pods
+                try:
+                    handler.poll(task_uuid=task_uuid)
+                except Exception as error:
+                    app.logger.warn("ERROR: task={}, error={}".format(task_uuid, error))
+
+    def is_ready(self, pod):
+        for condition in pod.status.conditions or []:
+            if condition.type == "Ready":
+                return condition.status == "True"
+        return False
+
+    def is_terminated(self, pod):
+        return any([status.state.terminated is not None for status in pod.status.container_statuses or []])
+
+
+def main():
+    namespaces = set([detector.POD_NAMESPACE for detector in dtm.detectors.values()])
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(namespaces))
+    for namespace in namespaces:
+        executor.submit(DetectorWatcher(namespace).run)
+
+
+print(' * Serving detector pod watcher "watcher.py"')
+
+
+if __name__ == "__main__":
+    main()
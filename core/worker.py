@@ -0,0 +1,57 @@
+import concurrent.futures
+import time
+
+from app import app
+from models import db
+from tasks.pending import PendingTaskHandler
+from tasks.pool import DetectorPoolHandler
+from tasks.running import RunningTaskHandler
+from tasks.schedule import TaskScheduler
+from tasks.stopped import StoppedTaskHandler
+
+PENDING_TASK_INTERVAL = 10
+RUNNING_TASK_INTERVAL = 10
+STOPPED_TASK_INTERVAL = 10
+TASK_SCHEDULE_INTERVAL = 10
+DETECTOR_POOL_INTERVAL = 10
+
+
+class TaskWorker:
+    def __init__(self, name, handler_class, interval):
+        self.name = name
+        self.handler_class = handler_class
+        self.interval = interval
+
+    def run(self):
+        while True:
+            started_at = time.time()
+            self.poll()
+            time.sleep(max(0, started_at + self.interval - time.time()))
+
+    def poll(self):
+        # Tasks are claimed with leases, so any number of worker replicas can poll the same queue
+        with app.app_context(), db.database.connection_context():
+            try:
+                self.handler_class().poll()
+            except Exception as error:
+                app.logger.warn("ERROR: worker={}, error={}".format(self.name, error))
+
+
+def main():
+    workers = [
+        TaskWorker("schedule", TaskScheduler, TASK_SCHEDULE_INTERVAL),
+        TaskWorker("pending", PendingTaskHandler, PENDING_TASK_INTERVAL),
+        TaskWorker("running", RunningTaskHandler, RUNNING_TASK_INTERVAL),
+        TaskWorker("stopped", StoppedTaskHandler, STOPPED_TASK_INTERVAL),
+        TaskWorker("pool", DetectorPoolHandler, DETECTOR_POOL_INTERVAL),
+    ]
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(workers))
+    for worker in workers:
+        executor.submit(worker.run)
+
+
+print(' * Serving task worker "worker.py"')
+
+
+if __name__ == "__main__":
+    main()